@@ -0,0 +1,48 @@
+# Test script for asynchronous routing
+# Runs offline against the mock backend: routed agent functions never block the event loop
+
+import asyncio
+import time
+from workflow_agents.backends import MockBackend
+from workflow_agents.base_agents import RoutingAgent
+from workflow_agents.embedding_cache import EmbeddingCache
+from workflow_agents.llm_client import LLMClient
+
+
+def slow_stories(prompt):
+    # A plain (blocking) agent function
+    time.sleep(0.2)
+    return f"stories for: {prompt}"
+
+
+async def async_tasks(prompt):
+    await asyncio.sleep(0.2)
+    return f"tasks for: {prompt}"
+
+
+routing_agent = RoutingAgent(None, embedding_cache=EmbeddingCache(), client=LLMClient(backend=MockBackend()))
+routing_agent.agents = [
+    {"name": "Product Manager", "description": "Writes user stories for user personas", "func": slow_stories},
+    {"name": "Development Engineer", "description": "Creates detailed engineering tasks", "func": async_tasks}
+]
+
+
+async def timed(coroutines):
+    start = time.perf_counter()
+    results = await asyncio.gather(*coroutines)
+    return results, time.perf_counter() - start
+
+# Plain and coroutine agent functions both run concurrently under route_async
+prompts = ["Write user stories for user personas"] * 5 + ["Create detailed engineering tasks"] * 5
+results, seconds = asyncio.run(timed(routing_agent.route_async(prompt) for prompt in prompts))
+print(f"route_async: {len(results)} prompts in {seconds:.2f}s")
+assert results[0] == "stories for: Write user stories for user personas"
+assert results[-1] == "tasks for: Create detailed engineering tasks"
+assert seconds < 0.6
+
+# route_many_async routes the whole batch at once and runs the chosen functions concurrently
+results, seconds = asyncio.run(timed([routing_agent.route_many_async(prompts)]))
+print(f"route_many_async: {len(results[0])} prompts in {seconds:.2f}s")
+assert results[0][0] == "stories for: Write user stories for user personas" and seconds < 0.6
+
+print("All async routing checks passed")
@@ -0,0 +1,130 @@
+# Test script for the completion and embedding caches
+# Runs offline against the mock backend: repeated requests are answered from the caches instead of the backend
+
+import os
+import tempfile
+import time
+import numpy as np
+from workflow_agents.backends import MockBackend
+from workflow_agents.budget import BudgetExceededError, BudgetManager
+from workflow_agents.completion_cache import CompletionCache, MemoryCacheBackend, SQLiteCacheBackend
+from workflow_agents.embedding_cache import EmbeddingCache
+from workflow_agents.llm_client import LLMClient
+from workflow_agents.routing_cache import RoutingCache
+
+messages = [{"role": "user", "content": "Summarize the Email Router spec"}]
+
+# A repeated chat request is served from the completion cache; the key covers model, messages and params
+completion_cache = CompletionCache()
+client = LLMClient(backend=MockBackend(), completion_cache=completion_cache)
+first = client.chat(messages)
+assert client.chat(messages) == first
+client.chat(messages, temperature=0)
+print(completion_cache.stats())
+assert completion_cache.stats()["hits"] == 1 and completion_cache.stats()["entries"] == 2
+
+# A refreshing cache (agentic_workflow.py --fresh) never answers from stored entries but replaces them
+refreshing = CompletionCache(completion_cache.backend, refresh=True)
+assert refreshing.get(client.chat_model, messages, {}) is None
+refreshing.put(client.chat_model, messages, {}, "new answer")
+assert completion_cache.get(client.chat_model, messages, {}) == "new answer"
+
+# Expired entries are dropped, and the memory backend evicts its least recently used entry when full
+expiring = CompletionCache(ttl=0.01)
+expiring.put("model", messages, {}, "answer")
+time.sleep(0.02)
+assert expiring.get("model", messages, {}) is None
+bounded = MemoryCacheBackend(max_entries=2)
+for key in ("a", "b", "c"):
+    bounded.set(key, key, time.time())
+assert bounded.get("a") is None and len(bounded) == 2
+
+# The SQLite backend keeps completions across processes
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, "completions.sqlite")
+    backend = SQLiteCacheBackend(path)
+    CompletionCache(backend).put("model", messages, {}, "persisted answer")
+    backend.close()
+    reopened = SQLiteCacheBackend(path)
+    assert CompletionCache(reopened).get("model", messages, {}) == "persisted answer"
+    reopened.close()
+
+# Past the budget's soft cap, an answer cached for the requested model is still used as is;
+# only cache misses are sent to the cheaper model
+completion_cache = CompletionCache()
+completion_cache.put("gpt-4o", messages, {}, "cached gpt-4o answer")
+budget = BudgetManager(max_tokens=1_000_000, soft_limit=0.0)
+client = LLMClient(backend=MockBackend(), completion_cache=completion_cache, budget=budget)
+assert client.chat(messages, model="gpt-4o") == "cached gpt-4o answer"
+assert budget.downgraded_calls == 0
+other_messages = [{"role": "user", "content": "List the user personas"}]
+client.chat(other_messages, model="gpt-4o")
+assert budget.downgraded_calls == 1
+assert completion_cache.get("gpt-4o-mini", other_messages, {}) is not None
+
+# A call blocked at the hard cap is counted as blocked, not also as downgraded
+budget = BudgetManager(max_tokens=1, soft_limit=0.0)
+client = LLMClient(backend=MockBackend(), budget=budget)
+client.chat(messages, model="gpt-4o")
+try:
+    client.chat(other_messages, model="gpt-4o")
+    raise AssertionError("call past the hard cap was not blocked")
+except BudgetExceededError:
+    pass
+print(budget.format_report().splitlines()[-1])
+assert budget.downgraded_calls == 1 and budget.blocked_calls == 1
+
+# Embeddings: an LRU memory tier backed by one .npy file per vector on disk
+with tempfile.TemporaryDirectory() as directory:
+    cache = EmbeddingCache(cache_dir=directory, max_memory_entries=2)
+    computed = []
+
+    def compute_many(texts):
+        computed.extend(texts)
+        return [np.full(4, len(text), dtype=np.float32) for text in texts]
+
+    cache.get_or_compute_many("model", ["one", "two", "one"], compute_many)
+    assert computed == ["one", "two"]
+    cache.get_or_compute_many("model", ["three"], compute_many)
+    assert cache.stats()["memory_entries"] == 2
+    # "one" was evicted from memory but is read back from disk, not recomputed
+    assert np.array_equal(cache.get("model", "one"), np.full(4, 3, dtype=np.float32))
+    assert computed == ["one", "two", "three"]
+    print(cache.stats())
+    assert cache.stats()["disk_hits"] == 1
+    assert EmbeddingCache(cache_dir=directory).get("other-model", "one") is None
+
+# Routing decisions: exact lookups ignore case and spacing, the least recently used decision is evicted first
+routing_cache = RoutingCache(max_entries=2)
+routing_cache.put("agents", "Define user stories", "Product Manager")
+routing_cache.put("agents", "Define features", "Program Manager")
+assert routing_cache.get("agents", "define  USER stories")["agent"] == "Product Manager"
+routing_cache.put("agents", "Create tasks", "Development Engineer")
+assert routing_cache.get("agents", "Define features") is None
+assert routing_cache.get("agents", "Define user stories") is not None
+assert routing_cache.get("other agents", "Define user stories") is None
+print(routing_cache.stats())
+assert routing_cache.stats()["evictions"] == 1 and len(routing_cache) == 2
+
+# Decisions older than the ttl are not used
+expiring = RoutingCache(ttl=0.01)
+expiring.put("agents", "Define user stories", "Product Manager")
+time.sleep(0.02)
+assert expiring.get("agents", "Define user stories") is None
+
+# The JSON file is rewritten every flush_every decisions and on flush(), not after each decision
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, "routing.json")
+    routing_cache = RoutingCache(path, flush_every=3)
+    routing_cache.put("agents", "one", "A")
+    routing_cache.put("agents", "two", "B")
+    assert not os.path.exists(path)
+    routing_cache.put("agents", "three", "C")
+    assert len(RoutingCache(path)) == 3
+    routing_cache.put("agents", "four", "D")
+    routing_cache.flush()
+    # Reloading under a smaller bound keeps the most recent decisions
+    reloaded = RoutingCache(path, max_entries=2)
+    assert reloaded.get("agents", "four")["agent"] == "D" and reloaded.get("agents", "one") is None
+
+print("All cache checks passed")
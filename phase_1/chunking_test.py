@@ -0,0 +1,42 @@
+# Test script for heading-aware chunking
+# Runs offline: checks how documents are split into sections and chunks
+
+from workflow_agents.chunking import chunk_document, split_sections
+
+# Numbered headings nest, and every chunk starts with its heading path
+spec = """1. Introduction
+1.1 Purpose
+The router sorts incoming email.
+1.2 Scope
+Only inbound email is covered.
+2. Features
+2.1 Routing
+Emails go to the right team."""
+sections = list(split_sections(spec.splitlines()))
+for section in sections:
+    print(f"{section['heading']}: {section['text']}")
+assert [section["heading"] for section in sections] == [
+    "1. Introduction > 1.1 Purpose",
+    "1. Introduction > 1.2 Scope",
+    "2. Features > 2.1 Routing"
+]
+assert chunk_document(spec)[0] == "1. Introduction > 1.1 Purpose\nThe router sorts incoming email."
+
+# Numbered list items are text, not empty sections, so the list is kept
+steps = "## Steps\n1. Install the package\n2. Configure the router\n"
+sections = list(split_sections(steps.splitlines()))
+print(sections)
+assert sections == [{"heading": "Steps", "text": "1. Install the package\n2. Configure the router"}]
+
+# A list followed by more text stays in one section
+steps_with_text = "## Steps\n1. Install the package\n2. Configure the router\nThen restart the service.\n"
+sections = list(split_sections(steps_with_text.splitlines()))
+assert len(sections) == 1 and sections[0]["text"].endswith("Then restart the service.")
+
+# Long sections are split within max_tokens, each chunk repeating the heading
+long_section = "## Notes\n" + "\n\n".join(f"Paragraph {i} " + "word " * 40 for i in range(10))
+chunks = chunk_document(long_section, max_tokens=60)
+print(f"{len(chunks)} chunks from a long section")
+assert len(chunks) > 1 and all(chunk.startswith("Notes\n") for chunk in chunks)
+
+print("All chunking checks passed")
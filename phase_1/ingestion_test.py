@@ -0,0 +1,48 @@
+# Test script for incremental knowledge ingestion
+# Runs offline against the mock backend: re-ingesting a changed file updates a RAG agent's index in place
+
+import os
+import tempfile
+from workflow_agents.backends import MockBackend
+from workflow_agents.base_agents import RAGKnowledgePromptAgent
+from workflow_agents.embedding_cache import EmbeddingCache
+from workflow_agents.ingestion import KnowledgeIngestor, apply_changes
+from workflow_agents.llm_client import LLMClient
+
+shared_section = "## Support\nContact the help desk for access problems.\n"
+
+with tempfile.TemporaryDirectory() as directory:
+    first_path = os.path.join(directory, "first.md")
+    second_path = os.path.join(directory, "second.md")
+    with open(first_path, "w", encoding="utf-8") as f:
+        f.write("## Routing\nEmails are routed by topic.\n" + shared_section)
+    with open(second_path, "w", encoding="utf-8") as f:
+        f.write("## Billing\nInvoices are sent monthly.\n" + shared_section)
+
+    ingestor = KnowledgeIngestor(max_tokens=100, overlap_tokens=0)
+    agent = RAGKnowledgePromptAgent(
+        None, "a support expert", [],
+        embedding_cache=EmbeddingCache(),
+        client=LLMClient(backend=MockBackend())
+    )
+    for path in (first_path, second_path):
+        apply_changes(agent, ingestor.ingest(path))
+    print(f"Indexed {len(agent.knowledge_documents)} chunks from two files")
+    assert len(agent.knowledge_documents) == 4
+
+    # Drop the shared section from the first file only
+    with open(first_path, "w", encoding="utf-8") as f:
+        f.write("## Routing\nEmails are routed by topic and urgency.\n")
+    changes = ingestor.ingest(first_path)
+    print(f"Re-ingest: {len(changes['added'])} added, {len(changes['removed'])} removed, {len(changes['unchanged'])} unchanged")
+    apply_changes(agent, changes)
+
+    documents = agent.knowledge_documents
+    for document in documents:
+        print(f"  {document!r}")
+    # The second file's copy of the shared section is still indexed
+    assert documents.count("Support\nContact the help desk for access problems.") == 1
+    assert "Routing\nEmails are routed by topic and urgency." in documents
+    assert "Routing\nEmails are routed by topic." not in documents
+
+print("All ingestion checks passed")
@@ -0,0 +1,45 @@
+# Test script for the BM25 lexical index and the routing agent's lexical tier
+# Runs offline against the mock backend: prompts only reach the lexical tier's decision with enough shared terms
+
+from workflow_agents.backends import MockBackend
+from workflow_agents.base_agents import ROUTE_LEXICAL, RoutingAgent
+from workflow_agents.embedding_cache import EmbeddingCache
+from workflow_agents.lexical_index import BM25Index, tokenize
+from workflow_agents.llm_client import LLMClient
+from workflow_agents.workflow_engine import ROLES
+
+# Stopwords are dropped and plurals and verb forms share a stem
+print(tokenize("Define the user stories and defining features"))
+assert tokenize("Define the user stories") == tokenize("defining user story")
+assert tokenize("the features") == tokenize("feature")
+
+# Documents sharing more query terms score higher; repeated query terms count once
+index = BM25Index()
+index.add(["user stories for personas", "product features and capabilities", "engineering tasks"])
+scores = index.scores("write user stories")
+print(scores)
+assert scores.argmax() == 0 and scores[1] == scores[2] == 0
+assert (index.scores("stories stories stories") == index.scores("stories")).all()
+assert index.matched_terms("user stories for engineering").tolist() == [2, 0, 1]
+assert not index.scores("unrelated words").any()
+
+# The routing agent decides lexically only on a clear winner sharing at least two terms with the prompt
+client = LLMClient(backend=MockBackend())
+router = RoutingAgent(None, embedding_cache=EmbeddingCache(), client=client)
+router.agents = [
+    {"name": name, "description": description.format(product="Email Router"), "func": lambda query: query}
+    for name, description, *_ in ROLES
+]
+for prompt in ("Define user personas and user stories", "Create detailed engineering tasks from features"):
+    agent, score = router.select_agent(prompt)
+    print(f"{prompt!r} -> {agent['name']} ({score:.2f})")
+    assert router.stats()["tiers"][ROUTE_LEXICAL]["hits"] > 0
+
+# One shared word ("plan") is not enough, however large its score: the prompt goes on to the next tiers
+lexical_hits = router.stats()["tiers"][ROUTE_LEXICAL]["hits"]
+print(router._lexical_index.scores("Draft the go-to-market plan"))
+assert router._lexical_choice("Draft the go-to-market plan") is None
+router.select_agent("Draft the go-to-market plan")
+assert router.stats()["tiers"][ROUTE_LEXICAL]["hits"] == lexical_hits
+
+print("All lexical index checks passed")
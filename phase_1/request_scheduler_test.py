@@ -0,0 +1,121 @@
+# Test script for the request scheduler
+# Runs offline: retries, concurrency and rate limits, and priority order, with plain functions standing in for API calls
+
+import asyncio
+import threading
+import time
+from workflow_agents.request_scheduler import RequestScheduler, is_transient
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class BadRequestError(Exception):
+    status_code = 400
+
+
+def flaky(failures, error=RateLimitError):
+    # Function that fails with error the first `failures` times and then returns "ok"
+    attempts = []
+
+    def func(timeout):
+        attempts.append(timeout)
+        if len(attempts) <= failures:
+            raise error("try again")
+        return "ok"
+    return func, attempts
+
+
+# Transient failures (429s, timeouts, 5xx) are retried with backoff; others are raised at once
+assert is_transient(RateLimitError()) and is_transient(TimeoutError()) and not is_transient(BadRequestError())
+scheduler = RequestScheduler(max_retries=3, base_delay=0.001, timeout=5.0, seed=0)
+func, attempts = flaky(2)
+event = {"retries": 0}
+assert scheduler.call(func, event=event) == "ok"
+assert attempts == [5.0, 5.0, 5.0] and event["retries"] == 2
+func, attempts = flaky(1, BadRequestError)
+try:
+    scheduler.call(func)
+    raise AssertionError("non-transient error was not raised")
+except BadRequestError:
+    assert len(attempts) == 1
+func, attempts = flaky(10)
+try:
+    scheduler.call(func)
+    raise AssertionError("retries were not limited")
+except RateLimitError:
+    assert len(attempts) == 4
+print(scheduler.stats())
+assert scheduler.stats() == {"active": 0, "waiting": 0, "retries": 5, "failures": 2}
+
+# A stream is retried only if it failed before yielding anything
+def broken_stream(timeout):
+    yield "partial"
+    raise RateLimitError("lost connection")
+
+try:
+    list(scheduler.stream(broken_stream))
+    raise AssertionError("stream error was not raised")
+except RateLimitError:
+    assert scheduler.retries == 5
+
+# No more than max_concurrency requests run at once
+scheduler = RequestScheduler(max_concurrency=2)
+running, peak, lock = [0], [0], threading.Lock()
+
+def slow(timeout):
+    with lock:
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+    time.sleep(0.02)
+    with lock:
+        running[0] -= 1
+
+threads = [threading.Thread(target=scheduler.call, args=(slow,)) for _ in range(6)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+print(f"peak concurrency {peak[0]}")
+assert peak[0] == 2
+
+# Queued embeddings are admitted ahead of queued chat completions
+scheduler = RequestScheduler(max_concurrency=1)
+order = []
+scheduler.acquire("chat")
+waiters = [threading.Thread(target=scheduler.call, args=(lambda timeout: order.append("chat"),), kwargs={"kind": "chat"})]
+waiters[0].start()
+time.sleep(0.02)
+waiters.append(threading.Thread(
+    target=scheduler.call, args=(lambda timeout: order.append("embedding"),), kwargs={"kind": "embedding"}
+))
+waiters[1].start()
+time.sleep(0.02)
+scheduler.release()
+for thread in waiters:
+    thread.join()
+assert order == ["embedding", "chat"]
+
+# With a requests-per-minute limit, requests beyond the first minute's allowance wait for the bucket to refill
+scheduler = RequestScheduler(requests_per_minute=600)
+scheduler._requests.level = 1
+start = time.perf_counter()
+scheduler.call(lambda timeout: None)
+scheduler.call(lambda timeout: None)
+waited = time.perf_counter() - start
+print(f"second request waited {waited:.3f}s")
+assert waited >= 0.08
+
+# Async calls share the same admission control and retries
+scheduler = RequestScheduler(max_concurrency=1, base_delay=0.001)
+func, attempts = flaky(1)
+
+async def call_async():
+    async def attempt(timeout):
+        return func(timeout)
+    return await scheduler.call_async(attempt)
+
+assert asyncio.run(call_async()) == "ok" and len(attempts) == 2
+
+print("All request scheduler checks passed")
@@ -0,0 +1,51 @@
+# Test script for dependency-aware step scheduling
+# Runs offline: builds step graphs from planner output and runs independent steps concurrently
+
+import threading
+import time
+from workflow_agents.step_scheduler import StepScheduler, build_step_graph
+
+# Dependencies refer to step numbers; unannotated steps wait for the step before them
+graph = build_step_graph([
+    "1. Define user personas and user stories (depends on: none)",
+    "2. Define product features based on user stories (depends on: 1)",
+    "3. Write the release announcement (depends on: none)",
+    "4. Create detailed engineering tasks from features"
+])
+for node in graph:
+    print(node)
+assert [node["depends_on"] for node in graph] == [[], [0], [], [2]]
+assert graph[1]["step"] == "Define product features based on user stories"
+
+# An unnumbered preamble does not take step number 1, so "(depends on: 1)" still means the stories step
+graph = build_step_graph([
+    "Here are the steps:",
+    "1. Define user personas and user stories (depends on: none)",
+    "2. Define product features based on user stories (depends on: 1)",
+    "3. Create detailed engineering tasks from features (depends on: 2)"
+])
+assert [node["depends_on"] for node in graph[1:]] == [[], [1], [2]]
+
+# Without any numbers, lines are numbered by position
+graph = build_step_graph(["Define stories", "Define features (depends on: 1)", "Plan tasks (depends on: 1, 2)"])
+assert [node["depends_on"] for node in graph] == [[], [0], [0, 1]]
+
+# Steps run as soon as their dependencies finish; independent steps overlap
+graph = build_step_graph(["1. A (depends on: none)", "2. B (depends on: none)", "3. C (depends on: 1, 2)"])
+running, peak, lock = [0], [0], threading.Lock()
+
+def run_step(step, dependency_results):
+    with lock:
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+    time.sleep(0.02)
+    with lock:
+        running[0] -= 1
+    return step + "".join(dependency_results.values())
+
+completed = []
+results = StepScheduler(run_step, max_workers=4, on_step_complete=lambda node, result: completed.append(node["step"])).run(graph)
+print(results)
+assert results == ["A", "B", "CAB"] and peak[0] == 2 and completed[-1] == "C"
+
+print("All step scheduler checks passed")
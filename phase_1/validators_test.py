@@ -0,0 +1,55 @@
+# Test script for the local structure validators
+# Runs offline: these checks decide many evaluations without an LLM judge
+
+from workflow_agents.validators import TASK_FIELDS, LabeledFieldsValidator, UserStoryValidator
+
+story_validator = UserStoryValidator()
+
+# Persona descriptions next to the stories are not attempted stories
+personas_and_stories = """Personas
+As a support lead, Sarah handles 300 emails per day.
+As an IT admin, Raj maintains the mail servers.
+
+User stories
+- As a support lead, I want emails grouped by topic so that my team answers faster.
+- **As an IT admin**, I want routing rules in one place so that changes are easy to audit."""
+result = story_validator(personas_and_stories)
+print(result)
+assert result[0] is True
+
+# A story missing its benefit fails, and the feedback quotes it
+result = story_validator("As a support lead, I want emails grouped by topic.")
+print(result)
+assert result[0] is False and "grouped by topic" in result[1]
+
+task_validator = LabeledFieldsValidator(TASK_FIELDS, "task")
+
+# Values may sit on the lines below their label
+tasks = """**Task ID:** T001
+**Task Title:** Build the routing engine
+Related User Story: Email administrator configures routing rules
+Description:
+Evaluate every incoming email against the routing rules.
+Acceptance Criteria:
+- Emails matching a rule reach the configured team
+- Unit tests cover every rule type
+Estimated Effort: 5 days
+Dependencies: None
+
+Task ID: T002
+Task Title: Add the analytics dashboard
+Related User Story: Support lead reviews response times
+Description: Show routing volumes per team.
+Acceptance Criteria: Dashboard loads in under two seconds
+Estimated Effort: 3 days
+Dependencies: T001"""
+result = task_validator(tasks)
+print(result)
+assert result == (True, "All 2 tasks include every required field.")
+
+# An empty value is still reported, even when the next label follows immediately
+result = task_validator(tasks.replace("Dependencies: T001", "Dependencies:"))
+print(result)
+assert result[0] is False and "task 2 is missing Dependencies" in result[1]
+
+print("All validator checks passed")
@@ -0,0 +1,57 @@
+# Test script for the vector indexes behind retrieval and routing
+# Runs offline: exact and IVF (approximate) cosine search over random vectors, plus a RAG agent's document updates
+
+import time
+import numpy as np
+from workflow_agents.backends import MockBackend
+from workflow_agents.base_agents import RAGKnowledgePromptAgent
+from workflow_agents.embedding_cache import EmbeddingCache
+from workflow_agents.llm_client import LLMClient
+from workflow_agents.vector_index import IVFVectorIndex, VectorIndex
+
+rng = np.random.default_rng(0)
+
+# Exact index: vectors are normalized on insertion, ids stay stable across removals
+index = VectorIndex(initial_capacity=2)
+ids = index.add([[1, 0, 0], [0, 2, 0], [0, 0, 3], [1, 1, 0]])
+assert index.best([0, 5, 0]) == (ids[1], 1.0)
+assert index.remove([ids[1]]) == 1 and len(index) == 3
+print(index.search([0, 1, 0], 2))
+assert index.search([0, 1, 0], 2)[0][0] == ids[3]
+assert VectorIndex().best([1, 0]) == (None, None)
+
+# IVF index: 8 well separated clusters; training converges long before the iteration cap
+centers = rng.normal(size=(8, 16))
+vectors = np.repeat(centers, 250, axis=0) + 0.05 * rng.normal(size=(2000, 16))
+ivf = IVFVectorIndex(n_lists=8, n_probe=2, train_threshold=10 ** 9, max_iterations=10 ** 6)
+ivf.add(vectors)
+start = time.perf_counter()
+ivf.train()
+seconds = time.perf_counter() - start
+print(f"IVF trained in {seconds:.3f}s")
+assert seconds < 2.0
+assert len(np.unique(ivf._assignments)) == 8
+
+# Searches probe a few buckets yet agree with exact search on clustered data
+exact = VectorIndex()
+exact.add(vectors)
+queries = centers + 0.05 * rng.normal(size=centers.shape)
+for query in queries:
+    assert [row for row, _ in ivf.search(query, 5)] == [row for row, _ in exact.search(query, 5)]
+
+# Vectors added after training are bucketed right away, and removed ones are never returned
+new_id = ivf.add([centers[0]])[0]
+assert ivf.best(centers[0])[0] == new_id
+ivf.remove([new_id])
+assert ivf.best(centers[0])[0] != new_id
+
+# A RAG agent's knowledge_documents can be replaced as a whole, like RoutingAgent.agents
+client = LLMClient(backend=MockBackend())
+agent = RAGKnowledgePromptAgent(None, "a support expert", ["Old fact one", "Old fact two"],
+                                embedding_cache=EmbeddingCache(), client=client)
+agent.knowledge_documents = ["New fact about routing"]
+print(agent.knowledge_documents)
+assert agent.knowledge_documents == ["New fact about routing"]
+assert agent.retrieve_relevant_knowledge("routing", top_k=5) == ["New fact about routing"]
+
+print("All vector index checks passed")
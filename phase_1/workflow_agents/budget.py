@@ -0,0 +1,149 @@
+# Run-level token budget and cost accounting
+# BudgetManager is a call hook: it tallies every LLMClient call and enforces soft and hard caps
+
+import threading
+from collections import defaultdict
+
+from .instrumentation import CallHook
+
+# Estimated USD per one million (prompt, completion) tokens; unknown models are counted at zero cost
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4-turbo": (10.00, 30.00),
+    "text-embedding-3-large": (0.13, 0.0),
+    "text-embedding-3-small": (0.02, 0.0)
+}
+
+# Cheaper chat model used in place of each model once the soft cap is reached
+# Embedding models are never swapped, since vectors from different models cannot be compared
+DOWNGRADE_MODELS = {
+    "gpt-4-turbo": "gpt-4o-mini",
+    "gpt-4o": "gpt-4o-mini",
+    "gpt-3.5-turbo": "gpt-4o-mini"
+}
+
+
+class BudgetExceededError(Exception):
+    """
+    Raised before an LLM call when the run has used up its hard token or cost budget.
+    """
+
+
+class BudgetManager(CallHook):
+    """
+    Tallies tokens and estimated cost per agent and per workflow step for one run.
+    max_tokens and max_cost are hard caps: once either is reached, further (uncached) calls
+    raise BudgetExceededError. Reaching soft_limit (a fraction of the hard caps) marks the
+    budget as tight, which makes EvaluationAgent stop iterating and LLMClient switch chat
+    calls to the cheaper models in downgrade_models.
+    Calls already in flight when a cap is crossed still complete, so totals can overshoot slightly.
+    """
+    GROUP_BY = ("agent", "step", "model")
+
+    def __init__(self, max_tokens=None, max_cost=None, soft_limit=0.8, prices=None, downgrade_models=None):
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.soft_limit = soft_limit
+        self.prices = MODEL_PRICES if prices is None else prices
+        self.downgrade_models = DOWNGRADE_MODELS if downgrade_models is None else downgrade_models
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._totals = self._empty()
+            self._groups = {field: defaultdict(self._empty) for field in self.GROUP_BY}
+            self.downgraded_calls = 0
+            self.blocked_calls = 0
+
+    @staticmethod
+    def _empty():
+        return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+
+    def cost_of(self, model, prompt_tokens, completion_tokens):
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+    @property
+    def tokens_used(self):
+        return self._totals["prompt_tokens"] + self._totals["completion_tokens"]
+
+    @property
+    def cost(self):
+        return self._totals["cost"]
+
+    def used_fraction(self):
+        # Share of the tightest cap used so far; 0.0 when no cap is set
+        fractions = [0.0]
+        if self.max_tokens:
+            fractions.append(self.tokens_used / self.max_tokens)
+        if self.max_cost:
+            fractions.append(self.cost / self.max_cost)
+        return max(fractions)
+
+    @property
+    def soft_limit_reached(self):
+        return self.used_fraction() >= self.soft_limit
+
+    @property
+    def hard_limit_reached(self):
+        return self.used_fraction() >= 1.0
+
+    def select_model(self, model, kind="chat"):
+        # Model to use for a call; chat calls fall back to a cheaper model once the soft cap is reached
+        if kind == "embedding" or not self.soft_limit_reached:
+            return model
+        return self.downgrade_models.get(model, model)
+
+    def on_call_start(self, event):
+        # Cache hits cost nothing and are always allowed; a call counts as downgraded only once it is allowed
+        if not event["cache_hit"] and self.hard_limit_reached:
+            with self._lock:
+                self.blocked_calls += 1
+            raise BudgetExceededError(f"Budget exhausted after {self.tokens_used} tokens (estimated cost ${self.cost:.4f})")
+        if event["model"] != event.get("requested_model", event["model"]):
+            with self._lock:
+                self.downgraded_calls += 1
+
+    def on_call_end(self, event):
+        cost = self.cost_of(event["model"], event["prompt_tokens"], event["completion_tokens"])
+        with self._lock:
+            for totals in [self._totals] + [groups[str(event.get(field))] for field, groups in self._groups.items()]:
+                totals["calls"] += 1
+                totals["prompt_tokens"] += event["prompt_tokens"]
+                totals["completion_tokens"] += event["completion_tokens"]
+                totals["cost"] += cost
+
+    def summary(self):
+        with self._lock:
+            return {
+                "total": dict(self._totals),
+                "max_tokens": self.max_tokens,
+                "max_cost": self.max_cost,
+                "downgraded_calls": self.downgraded_calls,
+                "blocked_calls": self.blocked_calls,
+                **{f"by_{field}": {key: dict(value) for key, value in groups.items()}
+                   for field, groups in self._groups.items()}
+            }
+
+    def format_report(self, group_by="agent"):
+        # Human-readable table of token and cost totals grouped by one field
+        summary = self.summary()
+        lines = [f"{group_by:<60} {'calls':>6} {'tokens':>10} {'est. cost':>11}"]
+        rows = sorted(summary[f"by_{group_by}"].items(), key=lambda item: -item[1]["cost"])
+        for key, totals in rows + [("TOTAL", summary["total"])]:
+            tokens = totals["prompt_tokens"] + totals["completion_tokens"]
+            lines.append(f"{key[:60]:<60} {totals['calls']:>6} {tokens:>10} {'$' + format(totals['cost'], '.4f'):>11}")
+        limits = []
+        if self.max_tokens:
+            limits.append(f"{self.max_tokens} tokens")
+        if self.max_cost:
+            limits.append(f"${self.max_cost}")
+        if limits:
+            lines.append(
+                f"Budget: {' / '.join(limits)} ({100 * self.used_fraction():.0f}% used), "
+                f"{summary['downgraded_calls']} calls downgraded, {summary['blocked_calls']} calls blocked"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,64 @@
+# Checkpoints for resumable workflow runs
+# Each finished step is stored under a hash of its exact input, so a rerun skips every step whose input is unchanged
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class CheckpointStore:
+    """
+    JSON file of completed workflow steps, keyed by (kind, input).
+    Records hold whatever the runner stores (routed agent, evaluation iterations, output, ...) plus the input
+    and completion time. fingerprint identifies everything else a step's output depends on (knowledge,
+    instructions, settings); when it differs from the stored one, earlier checkpoints are discarded.
+    The file is rewritten atomically after every step, so a crash loses at most the step in progress.
+    """
+    def __init__(self, path, fingerprint=None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._records = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("fingerprint") == fingerprint:
+                self._records = state.get("records", {})
+
+    @staticmethod
+    def make_fingerprint(*parts):
+        # Stable hash of everything outside a step's input that its output depends on
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_key(kind, step_input):
+        return hashlib.sha256(f"{kind}\0{step_input}".encode("utf-8")).hexdigest()
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, kind, step_input):
+        # Stored record for this exact input, or None
+        with self._lock:
+            record = self._records.get(self.make_key(kind, step_input))
+            return dict(record) if record is not None else None
+
+    def put(self, kind, step_input, **record):
+        record = {"kind": kind, "input": step_input, **record, "completed_at": time.time()}
+        with self._lock:
+            self._records[self.make_key(kind, step_input)] = record
+            self._save()
+        return record
+
+    def clear(self):
+        with self._lock:
+            self._records = {}
+            self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "records": self._records}, f, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,151 @@
+# Content-addressed embedding cache shared by the embedding-based agents
+# Keeps recently used vectors in memory and optionally persists every vector to disk
+# numpy is imported on first use so importing the agents stays cheap
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache for embedding vectors keyed by model name and a hash of the input text.
+    The memory tier is a bounded LRU; the optional disk tier stores one .npy file per vector
+    so embeddings survive process restarts.
+    """
+    def __init__(self, cache_dir=None, max_memory_entries=10000):
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(model, text):
+        # Content address: identical (model, text) pairs always map to the same key
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key):
+        # Shard files into sub-directories to keep directory listings small
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npy")
+
+    def _remember(self, key, embedding):
+        # Insert into the LRU tier, evicting the least recently used entry when full
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model, text):
+        # Look up a cached embedding, returning None on a miss
+        key = self.make_key(model, text)
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return embedding
+        if self.cache_dir:
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                import numpy as np
+
+                try:
+                    embedding = np.load(path)
+                except (OSError, ValueError):
+                    embedding = None
+                if embedding is not None:
+                    with self._lock:
+                        self._remember(key, embedding)
+                        self.disk_hits += 1
+                    return embedding
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, model, text, embedding):
+        # Store an embedding in memory and, if configured, on disk
+        import numpy as np
+
+        key = self.make_key(model, text)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._remember(key, embedding)
+        if self.cache_dir:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so concurrent readers never see partial vectors
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.save(f, embedding)
+                os.replace(tmp_path, path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        return embedding
+
+    def get_or_compute(self, model, text, compute):
+        # Return the cached embedding or compute, store and return a fresh one
+        embedding = self.get(model, text)
+        if embedding is None:
+            embedding = self.put(model, text, compute(text))
+        return embedding
+
+    def get_or_compute_many(self, model, texts, compute_many):
+        # Batch variant of get_or_compute: every distinct miss is passed to one compute_many call
+        embeddings = [self.get(model, text) for text in texts]
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing:
+            computed = {
+                text: self.put(model, text, embedding)
+                for text, embedding in zip(missing, compute_many(missing))
+            }
+            embeddings = [computed[text] if embedding is None else embedding for text, embedding in zip(texts, embeddings)]
+        return embeddings
+
+    def stats(self):
+        # Summarize hit/miss counters for both tiers
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory)
+            }
+
+    def clear(self, include_disk=False):
+        # Drop the memory tier (and optionally the disk tier) and reset counters
+        with self._lock:
+            self._memory.clear()
+            self.memory_hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+        if include_disk and self.cache_dir:
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(".npy"):
+                        os.remove(os.path.join(root, name))
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_embedding_cache():
+    # Process-wide cache shared by every agent that is not given its own cache
+    # Set EMBEDDING_CACHE_DIR to enable the on-disk tier
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache(cache_dir=os.getenv("EMBEDDING_CACHE_DIR"))
+        return _default_cache
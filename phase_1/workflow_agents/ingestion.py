@@ -0,0 +1,146 @@
+# Ingestion of knowledge files into retrievable chunks
+# Files are read through a memory map and re-ingested incrementally: only sections whose content hash changed are re-chunked
+
+import hashlib
+import json
+import mmap
+import os
+import threading
+
+from .chunking import chunk_section, split_sections
+
+
+def _mapped(f):
+    # Memory-map an open binary file; empty files cannot be mapped and yield None
+    if os.fstat(f.fileno()).st_size == 0:
+        return None
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def iter_file_lines(path, encoding="utf-8"):
+    # Yield the lines of a file one at a time from a memory map, without reading it into memory first
+    with open(path, "rb") as f:
+        mapped = _mapped(f)
+        if mapped is None:
+            return
+        with mapped:
+            for line in iter(mapped.readline, b""):
+                yield line.decode(encoding, errors="replace").rstrip("\r\n")
+
+
+def file_digest(path):
+    # sha256 of a file's bytes, hashed straight from the memory map
+    with open(path, "rb") as f:
+        mapped = _mapped(f)
+        if mapped is None:
+            return hashlib.sha256(b"").hexdigest()
+        with mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+
+def section_digest(section):
+    return hashlib.sha256(f"{section['heading']}\0{section['text']}".encode("utf-8")).hexdigest()
+
+
+class KnowledgeIngestor:
+    """
+    Turns knowledge files into heading-aware chunks for RAGKnowledgePromptAgent and keeps them current.
+    Each chunk is a dict {"id", "source", "heading", "section_hash", "text"}; id is unique across files. ingest(path) returns the changes since
+    the previous ingest of that file as {"added", "removed", "unchanged"} chunk lists; an unchanged file is
+    detected from its hash without being parsed, and unchanged sections keep their existing chunks.
+    With state_path set, per-file state is saved as JSON so re-ingests stay incremental across runs.
+    """
+    def __init__(self, max_tokens=200, overlap_tokens=30, state_path=None, encoding="utf-8"):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.state_path = state_path
+        self.encoding = encoding
+        self._lock = threading.Lock()
+        self._sources = {}
+        if state_path and os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            # Chunks made with other size settings are not reused
+            if state.get("settings") == self._settings():
+                self._sources = state["sources"]
+
+    def _settings(self):
+        return {"max_tokens": self.max_tokens, "overlap_tokens": self.overlap_tokens, "chunk_ids": True}
+
+    def _chunk(self, path, section, digest):
+        return [
+            {
+                "id": f"{path}#{digest}:{number}",
+                "source": path,
+                "heading": section["heading"],
+                "section_hash": digest,
+                "text": text
+            }
+            for number, text in enumerate(chunk_section(section, self.max_tokens, self.overlap_tokens))
+        ]
+
+    def ingest(self, path):
+        path = os.path.abspath(path)
+        digest = file_digest(path)
+        with self._lock:
+            previous = self._sources.get(path, {"file_hash": None, "sections": {}})
+        old_sections = previous["sections"]
+        if digest == previous["file_hash"]:
+            return {
+                "added": [],
+                "removed": [],
+                "unchanged": [chunk for chunks in old_sections.values() for chunk in chunks]
+            }
+
+        added = []
+        unchanged = []
+        sections = {}
+        for section in split_sections(iter_file_lines(path, self.encoding)):
+            section_hash = section_digest(section)
+            if section_hash in sections:
+                continue
+            if section_hash in old_sections:
+                sections[section_hash] = old_sections[section_hash]
+                unchanged.extend(sections[section_hash])
+            else:
+                sections[section_hash] = self._chunk(path, section, section_hash)
+                added.extend(sections[section_hash])
+        removed = [chunk for section_hash, chunks in old_sections.items() if section_hash not in sections for chunk in chunks]
+
+        with self._lock:
+            self._sources[path] = {"file_hash": digest, "sections": sections}
+        self.save()
+        return {"added": added, "removed": removed, "unchanged": unchanged}
+
+    def forget(self, path):
+        # Drop a file (for example one that was deleted); returns its chunks so they can be removed from an index
+        with self._lock:
+            source = self._sources.pop(os.path.abspath(path), None)
+        self.save()
+        return [chunk for chunks in source["sections"].values() for chunk in chunks] if source else []
+
+    def chunks(self, path=None):
+        # Current chunks of one file, or of every ingested file
+        with self._lock:
+            sources = [self._sources.get(os.path.abspath(path))] if path else list(self._sources.values())
+        return [chunk for source in sources if source for chunks in source["sections"].values() for chunk in chunks]
+
+    def save(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            state = {"settings": self._settings(), "sources": self._sources}
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+
+
+def apply_changes(agent, changes):
+    # Bring a RAGKnowledgePromptAgent's index in line with the result of KnowledgeIngestor.ingest
+    # Chunks are added and removed by id, so identical text from another file or section is left alone
+    # A newly created agent should first get every current chunk: apply_changes(agent, {"added": ingestor.chunks(), "removed": []})
+    if changes["removed"]:
+        agent.remove_keys(chunk["id"] for chunk in changes["removed"])
+    added = changes["added"]
+    return agent.add_documents([chunk["text"] for chunk in added], keys=[chunk["id"] for chunk in added])
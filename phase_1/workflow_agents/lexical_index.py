@@ -0,0 +1,89 @@
+# Local lexical index used as the routing agent's first, offline tier
+# Okapi BM25 over a handful of short documents (agent descriptions), computed with NumPy only
+
+import re
+from collections import Counter
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Function words carry no routing signal and would otherwise match every description
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in into is it its of on or that the their then this to was "
+    "were will with each all any should must can using use".split()
+)
+
+
+def stem(token):
+    # Light suffix stripping so "stories"/"story", "features"/"feature" and "defining"/"define" match
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(token) - len(suffix) >= 3 and token.endswith(suffix) and not token.endswith("ss"):
+            token = token[:-len(suffix)]
+            break
+    if len(token) > 3 and token.endswith("e"):
+        token = token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [stem(token) for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 scores of a query against every document, as one dense term-weight matrix.
+    Rows are documents in insertion order; the matrix is rebuilt on add, which suits small, rarely
+    changing collections such as the descriptions of registered agents.
+    """
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._documents = []
+        self._vocabulary = {}
+        self._weights = np.empty((0, 0), dtype=np.float32)
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, texts):
+        self._documents.extend(Counter(tokenize(text)) for text in texts)
+        self._build()
+
+    def clear(self):
+        self._documents = []
+        self._vocabulary = {}
+        self._weights = np.empty((0, 0), dtype=np.float32)
+
+    def _build(self):
+        # Precompute idf * saturated term frequency per (document, term), so scoring is a column sum
+        self._vocabulary = {term: column for column, term in enumerate(sorted(set().union(*self._documents)))}
+        counts = np.zeros((len(self._documents), len(self._vocabulary)), dtype=np.float32)
+        for row, document in enumerate(self._documents):
+            for term, count in document.items():
+                counts[row, self._vocabulary[term]] = count
+        lengths = counts.sum(axis=1, keepdims=True)
+        average_length = max(float(lengths.mean()), 1.0)
+        document_frequency = (counts > 0).sum(axis=0)
+        idf = np.log((len(self._documents) - document_frequency + 0.5) / (document_frequency + 0.5) + 1.0)
+        saturation = counts + self.k1 * (1 - self.b + self.b * lengths / average_length)
+        self._weights = (idf * counts * (self.k1 + 1) / saturation).astype(np.float32)
+
+    def _columns(self, query):
+        return [self._vocabulary[term] for term in dict.fromkeys(tokenize(query)) if term in self._vocabulary]
+
+    def scores(self, query):
+        # BM25 score of every document; each distinct query term counts once, unknown terms contribute nothing
+        if not self._documents:
+            return np.empty(0, dtype=np.float32)
+        columns = self._columns(query)
+        if not columns:
+            return np.zeros(len(self._documents), dtype=np.float32)
+        return self._weights[:, columns].sum(axis=1)
+
+    def matched_terms(self, query):
+        # Number of distinct query terms found in every document
+        if not self._documents:
+            return np.empty(0, dtype=np.int64)
+        return (self._weights[:, self._columns(query)] > 0).sum(axis=1)
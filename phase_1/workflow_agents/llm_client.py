@@ -0,0 +1,299 @@
+# Shared LLM client layer used by every agent
+# One backend (and connection pool) per endpoint, plus a single place to schedule, retry, cache and batch requests
+
+import asyncio
+import os
+import threading
+import time
+
+from .backends import create_backend, estimate_tokens
+from .instrumentation import current_labels
+from .request_scheduler import RequestScheduler
+
+CHAT_MODEL = "gpt-3.5-turbo"
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBEDDING_BATCH_SIZE = 100
+
+
+class LLMClient:
+    """
+    Pooled chat/embedding client that can be shared by any number of agents.
+    Requests go to a pluggable backend (OpenAIBackend or MockBackend, chosen from LLM_BACKEND by default)
+    through a RequestScheduler, which applies concurrency and rate limits, priorities, per-call timeouts
+    and retries of transient failures; max_concurrency configures the default scheduler.
+    An optional CompletionCache answers repeated chat requests without calling the backend.
+    Models default to LLM_CHAT_MODEL / LLM_EMBEDDING_MODEL when set.
+    Hooks (see instrumentation.CallHook) are notified at the start and end of every call.
+    An optional BudgetManager is registered as a hook and, once its soft cap is reached, may swap chat models
+    for calls the completion cache cannot answer.
+    """
+    def __init__(self, api_key=None, base_url=None, max_connections=20, max_keepalive_connections=10,
+                 keepalive_expiry=30.0, max_concurrency=None, timeout=60.0, completion_cache=None,
+                 backend=None, chat_model=None, embedding_model=None, hooks=None, budget=None, scheduler=None):
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.completion_cache = completion_cache
+        self.chat_model = chat_model or os.getenv("LLM_CHAT_MODEL", CHAT_MODEL)
+        self.embedding_model = embedding_model or os.getenv("LLM_EMBEDDING_MODEL", EMBEDDING_MODEL)
+        self._backend = backend
+        self._backend_options = {
+            "base_url": base_url,
+            "max_connections": max_connections,
+            "max_keepalive_connections": max_keepalive_connections,
+            "keepalive_expiry": keepalive_expiry,
+            "timeout": timeout
+        }
+        self._backend_lock = threading.Lock()
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler(max_concurrency=max_concurrency)
+        self.hooks = list(hooks or [])
+        self.budget = budget
+        if budget is not None:
+            self.hooks.append(budget)
+        self._call_ids = 0
+        self._call_id_lock = threading.Lock()
+
+    @property
+    def backend(self):
+        # Created on first request, so building clients and agents never imports the OpenAI SDK or opens a pool
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = create_backend(self.api_key, **self._backend_options)
+        return self._backend
+
+    def add_hook(self, hook):
+        # Register a CallHook (or any object with on_call_start/on_call_end) for every call
+        self.hooks.append(hook)
+        return hook
+
+    def _start_event(self, kind, model, agent, cache_hit=False, requested_model=None):
+        with self._call_id_lock:
+            self._call_ids += 1
+            call_id = self._call_ids
+        event = {
+            "call_id": call_id,
+            "kind": kind,
+            "model": model,
+            "requested_model": requested_model or model,
+            "agent": agent,
+            **current_labels(),
+            "start_time": time.time(),
+            "cache_hit": cache_hit,
+            "retries": 0,
+            "_started": time.perf_counter()
+        }
+        for hook in self.hooks:
+            if hasattr(hook, "on_call_start"):
+                hook.on_call_start(event)
+        return event
+
+    def _end_event(self, event, usage=None, error=None, usage_estimated=False):
+        event["latency"] = time.perf_counter() - event.pop("_started")
+        event["prompt_tokens"] = (usage or {}).get("prompt_tokens", 0)
+        event["completion_tokens"] = (usage or {}).get("completion_tokens", 0)
+        event["usage_estimated"] = usage_estimated
+        event["error"] = None if error is None else f"{type(error).__name__}: {error}"
+        for hook in self.hooks:
+            if hasattr(hook, "on_call_end"):
+                hook.on_call_end(event)
+
+    def _cached_completion(self, messages, model, params):
+        if self.completion_cache is None or not self.completion_cache.is_cacheable(params):
+            return None
+        return self.completion_cache.get(model, messages, params)
+
+    def _resolve_chat(self, messages, model, params):
+        # (requested model, model to use, cached content or None); an answer cached for the requested model is
+        # always used, and the budget's cheaper model only replaces it for calls that miss the cache
+        requested = model = model or self.chat_model
+        content = self._cached_completion(messages, model, params)
+        if content is None and self.budget is not None:
+            model = self.budget.select_model(model)
+            if model != requested:
+                content = self._cached_completion(messages, model, params)
+        return requested, model, content
+
+    def _store_completion(self, messages, model, params, content):
+        if self.completion_cache is not None and self.completion_cache.is_cacheable(params):
+            self.completion_cache.put(model, messages, params, content)
+
+    def _cache_hit(self, kind, model, agent, requested_model=None):
+        # Cache hits are still reported to hooks, with zero tokens
+        self._end_event(self._start_event(kind, model, agent, cache_hit=True, requested_model=requested_model))
+
+    def chat(self, messages, model=None, agent=None, priority=None, **params):
+        # Run a chat completion and return the message content
+        # agent labels the call for hooks, priority overrides the scheduler's default for chat calls;
+        # remaining params are passed to the backend
+        requested, model, content = self._resolve_chat(messages, model, params)
+        if content is not None:
+            self._cache_hit("chat", model, agent, requested)
+            return content
+        event = self._start_event("chat", model, agent, requested_model=requested)
+        reserved = self._reserved_tokens(messages, params)
+        try:
+            content, usage = self.scheduler.call(
+                lambda timeout: self.backend.chat(model, messages, timeout=timeout, **params),
+                kind="chat", priority=priority, tokens=reserved, event=event
+            )
+        except Exception as error:
+            self._end_event(event, error=error)
+            raise
+        self.scheduler.settle_tokens(reserved, usage)
+        self._end_event(event, usage=usage)
+        self._store_completion(messages, model, params, content)
+        return content
+
+    async def chat_async(self, messages, model=None, agent=None, priority=None, **params):
+        requested, model, content = self._resolve_chat(messages, model, params)
+        if content is not None:
+            self._cache_hit("chat", model, agent, requested)
+            return content
+        event = self._start_event("chat", model, agent, requested_model=requested)
+        reserved = self._reserved_tokens(messages, params)
+        try:
+            content, usage = await self.scheduler.call_async(
+                lambda timeout: self.backend.chat_async(model, messages, timeout=timeout, **params),
+                kind="chat", priority=priority, tokens=reserved, event=event
+            )
+        except Exception as error:
+            self._end_event(event, error=error)
+            raise
+        self.scheduler.settle_tokens(reserved, usage)
+        self._end_event(event, usage=usage)
+        self._store_completion(messages, model, params, content)
+        return content
+
+    @staticmethod
+    def _reserved_tokens(messages, params):
+        # Tokens reserved against the tokens/min limit before a chat request; settled against actual usage after
+        return sum(estimate_tokens(message["content"]) for message in messages) + (params.get("max_tokens") or 0)
+
+    @staticmethod
+    def _estimated_usage(messages, content):
+        # Streams report no usage, so token counts are estimated from the text
+        return {
+            "prompt_tokens": sum(estimate_tokens(message["content"]) for message in messages),
+            "completion_tokens": estimate_tokens(content)
+        }
+
+    def chat_stream(self, messages, model=None, agent=None, priority=None, **params):
+        # Yield the completion text incrementally as chunks arrive; a cached completion is yielded whole
+        # A failed stream is only retried if nothing had been yielded yet
+        requested, model, content = self._resolve_chat(messages, model, params)
+        if content is not None:
+            self._cache_hit("chat_stream", model, agent, requested)
+            yield content
+            return
+        event = self._start_event("chat_stream", model, agent, requested_model=requested)
+        reserved = self._reserved_tokens(messages, params)
+        parts = []
+        try:
+            for delta in self.scheduler.stream(
+                lambda timeout: self.backend.chat_stream(model, messages, timeout=timeout, **params),
+                kind="chat_stream", priority=priority, tokens=reserved, event=event
+            ):
+                parts.append(delta)
+                yield delta
+        except Exception as error:
+            self._end_event(event, error=error)
+            raise
+        content = "".join(parts)
+        usage = self._estimated_usage(messages, content)
+        self.scheduler.settle_tokens(reserved, usage)
+        self._end_event(event, usage=usage, usage_estimated=True)
+        self._store_completion(messages, model, params, content)
+
+    async def chat_stream_async(self, messages, model=None, agent=None, priority=None, **params):
+        requested, model, content = self._resolve_chat(messages, model, params)
+        if content is not None:
+            self._cache_hit("chat_stream", model, agent, requested)
+            yield content
+            return
+        event = self._start_event("chat_stream", model, agent, requested_model=requested)
+        reserved = self._reserved_tokens(messages, params)
+        parts = []
+        try:
+            async for delta in self.scheduler.stream_async(
+                lambda timeout: self.backend.chat_stream_async(model, messages, timeout=timeout, **params),
+                kind="chat_stream", priority=priority, tokens=reserved, event=event
+            ):
+                parts.append(delta)
+                yield delta
+        except Exception as error:
+            self._end_event(event, error=error)
+            raise
+        content = "".join(parts)
+        usage = self._estimated_usage(messages, content)
+        self.scheduler.settle_tokens(reserved, usage)
+        self._end_event(event, usage=usage, usage_estimated=True)
+        self._store_completion(messages, model, params, content)
+
+    def embed(self, texts, model=None, batch_size=EMBEDDING_BATCH_SIZE, agent=None, priority=None):
+        # Embed texts with one embeddings request per batch instead of one per text
+        model = model or self.embedding_model
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            texts_batch = texts[start:start + batch_size]
+            event = self._start_event("embedding", model, agent)
+            reserved = sum(estimate_tokens(text) for text in texts_batch)
+            try:
+                batch, usage = self.scheduler.call(
+                    lambda timeout: self.backend.embed(model, texts_batch, timeout=timeout),
+                    kind="embedding", priority=priority, tokens=reserved, event=event
+                )
+            except Exception as error:
+                self._end_event(event, error=error)
+                raise
+            self.scheduler.settle_tokens(reserved, usage)
+            self._end_event(event, usage=usage)
+            embeddings.extend(batch)
+        return embeddings
+
+    async def embed_async(self, texts, model=None, batch_size=EMBEDDING_BATCH_SIZE, agent=None, priority=None):
+        # Batches are requested concurrently, still subject to the scheduler's limits
+        model = model or self.embedding_model
+
+        async def embed_batch(batch):
+            event = self._start_event("embedding", model, agent)
+            reserved = sum(estimate_tokens(text) for text in batch)
+            try:
+                vectors, usage = await self.scheduler.call_async(
+                    lambda timeout: self.backend.embed_async(model, batch, timeout=timeout),
+                    kind="embedding", priority=priority, tokens=reserved, event=event
+                )
+            except Exception as error:
+                self._end_event(event, error=error)
+                raise
+            self.scheduler.settle_tokens(reserved, usage)
+            self._end_event(event, usage=usage)
+            return vectors
+
+        batches = await asyncio.gather(*[
+            embed_batch(texts[start:start + batch_size])
+            for start in range(0, len(texts), batch_size)
+        ])
+        return [embedding for batch in batches for embedding in batch]
+
+    def close(self):
+        if self._backend is not None:
+            self._backend.close()
+
+    async def close_async(self):
+        if self._backend is not None:
+            await self._backend.close_async()
+
+
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_client(api_key, base_url=None, **options):
+    # One LLMClient per (api key, endpoint); options only apply when the client is first created
+    key = (api_key, base_url)
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client = LLMClient(api_key, base_url=base_url, **options)
+            _shared_clients[key] = client
+        return client
@@ -0,0 +1,259 @@
+# Central admission control for backend requests
+# Rate limits (requests and tokens per minute), concurrency, priority, timeouts and retries with backoff
+
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+
+# Lower values are admitted first; embeddings (used for routing and retrieval) are short and
+# gate whole workflow steps, so by default they go ahead of long chat completions
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+DEFAULT_PRIORITIES = {"embedding": PRIORITY_HIGH, "chat": PRIORITY_NORMAL, "chat_stream": PRIORITY_NORMAL}
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server-side failures
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# Client exception types (matched by name so no client library has to be imported) that are transient
+TRANSIENT_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "ConnectTimeout", "ReadTimeout", "RemoteProtocolError"}
+
+
+def is_transient(error):
+    # Whether a failed request is likely to succeed if retried
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in TRANSIENT_STATUS_CODES
+    return type(error).__name__ in TRANSIENT_ERROR_NAMES
+
+
+def retry_after(error):
+    # Server-requested delay in seconds from a Retry-After header, if the error carries one
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute, holding at most capacity (one minute's worth by default).
+    The level may go negative when actual usage turns out higher than reserved, which delays later requests.
+    """
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount):
+        # Seconds until amount can be taken; requests larger than capacity only wait for a full bucket
+        self._refill()
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount):
+        self._refill()
+        self.level -= amount
+
+
+class RequestScheduler:
+    """
+    Admits backend requests in priority order under optional limits on concurrency, requests per minute
+    and tokens per minute, and retries transient failures with exponential backoff and full jitter.
+    timeout applies to every attempt unless timeouts overrides it per call kind ("chat", "chat_stream", "embedding").
+    One scheduler can be shared by several LLMClients so that concurrent workflows share the same limits.
+    """
+    def __init__(self, max_concurrency=None, requests_per_minute=None, tokens_per_minute=None, max_retries=3,
+                 base_delay=0.5, max_delay=30.0, timeout=None, timeouts=None, priorities=None, seed=None):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.timeouts = dict(timeouts or {})
+        self.priorities = {**DEFAULT_PRIORITIES, **(priorities or {})}
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._random = random.Random(seed)
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._tickets = itertools.count()
+        self._active = 0
+        self.retries = 0
+        self.failures = 0
+
+    def timeout_for(self, kind):
+        return self.timeouts.get(kind, self.timeout)
+
+    def backoff(self, attempt, error=None):
+        # Full-jitter exponential backoff, never shorter than a server-requested Retry-After
+        delay = self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        requested = retry_after(error) if error is not None else None
+        return max(delay, min(requested, self.max_delay)) if requested else delay
+
+    def _try_admit(self, ticket, tokens):
+        # Called with the condition held; returns 0.0 once admitted, otherwise seconds to wait (None: until notified)
+        if self._waiting[0] != ticket or (self.max_concurrency and self._active >= self.max_concurrency):
+            return None
+        delay = max(
+            self._requests.delay(1) if self._requests else 0.0,
+            self._tokens.delay(tokens) if self._tokens else 0.0
+        )
+        if delay > 0:
+            return delay
+        if self._requests:
+            self._requests.take(1)
+        if self._tokens:
+            self._tokens.take(tokens)
+        heapq.heappop(self._waiting)
+        self._active += 1
+        self._condition.notify_all()
+        return 0.0
+
+    def _enqueue(self, kind, priority):
+        ticket = (self.priorities.get(kind, PRIORITY_NORMAL) if priority is None else priority, next(self._tickets))
+        heapq.heappush(self._waiting, ticket)
+        return ticket
+
+    def _dequeue(self, ticket):
+        # Give up a place in the queue (for example when an async caller is cancelled)
+        if ticket in self._waiting:
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+            self._condition.notify_all()
+
+    def acquire(self, kind="chat", priority=None, tokens=0):
+        # Block until the request may start; pair with release()
+        with self._condition:
+            ticket = self._enqueue(kind, priority)
+            while True:
+                wait = self._try_admit(ticket, tokens)
+                if wait == 0.0:
+                    return
+                self._condition.wait(wait)
+
+    async def acquire_async(self, kind="chat", priority=None, tokens=0):
+        # Same admission order as acquire, polled so the event loop is never blocked
+        with self._condition:
+            ticket = self._enqueue(kind, priority)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_admit(ticket, tokens)
+                if wait == 0.0:
+                    return
+                await asyncio.sleep(min(wait, 0.05) if wait is not None else 0.005)
+        except BaseException:
+            with self._condition:
+                self._dequeue(ticket)
+            raise
+
+    def release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def settle_tokens(self, reserved, usage):
+        # Charge the tokens/min bucket for the difference between the reservation and actual usage
+        if self._tokens is None or not usage:
+            return
+        actual = usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+        with self._condition:
+            self._tokens.take(actual - reserved)
+
+    def _retry(self, error, attempt, event):
+        # Whether to retry after a failed attempt; counts the retry on the scheduler and the call event
+        if attempt >= self.max_retries or not is_transient(error):
+            with self._condition:
+                self.failures += 1
+            return False
+        with self._condition:
+            self.retries += 1
+        if event is not None:
+            event["retries"] += 1
+        return True
+
+    def call(self, func, kind="chat", priority=None, tokens=0, event=None):
+        """
+        Run func(timeout) under the scheduler's limits, retrying transient failures.
+        event, the call's instrumentation event, gets its "retries" count updated.
+        """
+        timeout = self.timeout_for(kind)
+        for attempt in itertools.count():
+            self.acquire(kind, priority, tokens)
+            try:
+                return func(timeout)
+            except Exception as error:
+                if not self._retry(error, attempt, event):
+                    raise
+                delay = self.backoff(attempt, error)
+            finally:
+                self.release()
+            time.sleep(delay)
+
+    async def call_async(self, func, kind="chat", priority=None, tokens=0, event=None):
+        # func(timeout) returns an awaitable; the timeout is also enforced here with asyncio.wait_for
+        timeout = self.timeout_for(kind)
+        for attempt in itertools.count():
+            await self.acquire_async(kind, priority, tokens)
+            try:
+                return await asyncio.wait_for(func(timeout), timeout)
+            except Exception as error:
+                if not self._retry(error, attempt, event):
+                    raise
+                delay = self.backoff(attempt, error)
+            finally:
+                self.release()
+            await asyncio.sleep(delay)
+
+    def stream(self, func, kind="chat_stream", priority=None, tokens=0, event=None):
+        # Iterate func(timeout); a failed attempt is retried only if it had not produced any output yet
+        timeout = self.timeout_for(kind)
+        for attempt in itertools.count():
+            started = False
+            self.acquire(kind, priority, tokens)
+            try:
+                for item in func(timeout):
+                    started = True
+                    yield item
+                return
+            except Exception as error:
+                if started or not self._retry(error, attempt, event):
+                    raise
+                delay = self.backoff(attempt, error)
+            finally:
+                self.release()
+            time.sleep(delay)
+
+    async def stream_async(self, func, kind="chat_stream", priority=None, tokens=0, event=None):
+        timeout = self.timeout_for(kind)
+        for attempt in itertools.count():
+            started = False
+            await self.acquire_async(kind, priority, tokens)
+            try:
+                async for item in func(timeout):
+                    started = True
+                    yield item
+                return
+            except Exception as error:
+                if started or not self._retry(error, attempt, event):
+                    raise
+                delay = self.backoff(attempt, error)
+            finally:
+                self.release()
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        with self._condition:
+            return {"active": self._active, "waiting": len(self._waiting), "retries": self.retries, "failures": self.failures}
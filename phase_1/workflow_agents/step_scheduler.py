@@ -0,0 +1,106 @@
+# Dependency-aware execution of workflow steps
+# Builds a DAG from the action planner's steps and runs independent steps concurrently
+
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+STEP_NUMBER_PATTERN = re.compile(r"^\s*(?:step\s*)?(\d+)\s*[.):-]\s*", re.IGNORECASE)
+DEPENDENCY_PATTERN = re.compile(r"\(\s*(?:depends on|dependencies|requires)\s*:?\s*([^)]*)\)", re.IGNORECASE)
+
+
+def parse_step(step):
+    # Split a planner line into (number, text, dependencies); dependencies is None when not annotated
+    number = None
+    match = STEP_NUMBER_PATTERN.match(step)
+    if match:
+        number = int(match.group(1))
+        step = step[match.end():]
+    dependencies = None
+    match = DEPENDENCY_PATTERN.search(step)
+    if match:
+        dependencies = [int(n) for n in re.findall(r"\d+", match.group(1))]
+        step = (step[:match.start()] + step[match.end():]).strip()
+    return number, step.strip(), dependencies
+
+
+def build_step_graph(steps):
+    """
+    Turn planner output into a list of nodes {"index", "step", "depends_on"}.
+    Dependencies come from "(depends on: 1, 2)" annotations and refer to step numbers; lines are numbered
+    by position only when none carries a number, so an unnumbered preamble never takes a step's number.
+    Steps without an annotation conservatively depend on the step before them.
+    """
+    parsed = [parse_step(step) for step in steps]
+    numbered = any(number is not None for number, _, _ in parsed)
+    number_to_index = {}
+    for index, (number, _, _) in enumerate(parsed):
+        if numbered and number is None:
+            continue
+        number_to_index.setdefault(number if numbered else index + 1, index)
+
+    graph = []
+    for index, (_, text, dependencies) in enumerate(parsed):
+        if dependencies is None:
+            depends_on = [index - 1] if index > 0 else []
+        else:
+            # Only earlier steps are honoured, which also rules out cycles
+            depends_on = sorted({
+                number_to_index[n] for n in dependencies
+                if n in number_to_index and number_to_index[n] < index
+            })
+        graph.append({"index": index, "step": text, "depends_on": depends_on})
+    return graph
+
+
+class StepScheduler:
+    """
+    Runs a step graph on a bounded thread pool.
+    run_step(step, dependency_results) is called as soon as all of a step's dependencies
+    have finished; dependency_results maps dependency index to that step's output.
+    on_step_start(node) and on_step_complete(node, result) are serialized with a lock.
+    """
+    def __init__(self, run_step, max_workers=4, on_step_start=None, on_step_complete=None):
+        self.run_step = run_step
+        self.max_workers = max_workers
+        self.on_step_start = on_step_start
+        self.on_step_complete = on_step_complete
+        self._callback_lock = threading.Lock()
+
+    def _run_node(self, node, dependency_results):
+        if self.on_step_start:
+            with self._callback_lock:
+                self.on_step_start(node)
+        return self.run_step(node["step"], dependency_results)
+
+    def run(self, graph):
+        # Returns step outputs in graph order
+        results = {}
+        remaining = {node["index"]: set(node["depends_on"]) for node in graph}
+        nodes = {node["index"]: node for node in graph}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while remaining or running:
+                ready = [index for index, deps in remaining.items() if not deps]
+                for index in sorted(ready):
+                    del remaining[index]
+                    node = nodes[index]
+                    dependency_results = {dep: results[dep] for dep in node["depends_on"]}
+                    running[executor.submit(self._run_node, node, dependency_results)] = index
+
+                if not running:
+                    raise ValueError("Step graph has unsatisfiable dependencies")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    # Re-raises the step's exception; the executor still waits for running steps
+                    results[index] = future.result()
+                    for deps in remaining.values():
+                        deps.discard(index)
+                    if self.on_step_complete:
+                        with self._callback_lock:
+                            self.on_step_complete(nodes[index], results[index])
+
+        return [results[node["index"]] for node in graph]
@@ -0,0 +1,127 @@
+# Local rule-based validators for structured agent output
+# Each validator is a callable usable as EvaluationAgent's pre_check: it returns (passed, feedback),
+# or None to leave the decision to the LLM judge
+
+import re
+
+# Fields required in each Program Manager feature and Development Engineer task
+FEATURE_FIELDS = ("Feature Name", "Description", "Key Functionality", "User Benefit")
+TASK_FIELDS = (
+    "Task ID",
+    "Task Title",
+    "Related User Story",
+    "Description",
+    "Acceptance Criteria",
+    "Estimated Effort",
+    "Dependencies"
+)
+
+# Markdown emphasis is ignored so "**Task ID:** T001" counts the same as "Task ID: T001"
+EMPHASIS_PATTERN = re.compile(r"\*\*|__")
+# Bullets, numbering and heading marks allowed in front of a story or field label
+LINE_PREFIX = r"^[ \t]*(?:[-*+#>]+[ \t]*|\d+[.)][ \t]*)*"
+
+
+def _strip_emphasis(text):
+    return EMPHASIS_PATTERN.sub("", text)
+
+
+class UserStoryValidator:
+    """
+    Checks that a response contains user stories of the form
+    "As a [type of user], I want [an action or feature] so that [benefit/value]".
+    Lines that start like a story ("As a ..., I want ...") but do not complete the structure fail the check;
+    other lines starting with "As a", such as persona descriptions, are ignored.
+    With defer_on_pass, well-formed responses are passed on to the LLM judge for any semantic criteria.
+    """
+    STORY_START_PATTERN = re.compile(LINE_PREFIX + r"As an?\b[^\n]*?\bI want\b", re.IGNORECASE | re.MULTILINE)
+    STORY_PATTERN = re.compile(
+        LINE_PREFIX + r"As an?\s+(?P<user>[^\n,]+?),?\s+I want\s+(?P<action>[^\n]+?),?\s+so that\s+(?P<benefit>\S[^\n]*)$",
+        re.IGNORECASE | re.MULTILINE
+    )
+
+    def __init__(self, min_stories=1, defer_on_pass=False):
+        self.min_stories = min_stories
+        self.defer_on_pass = defer_on_pass
+
+    def __call__(self, response):
+        text = _strip_emphasis(response)
+        stories = self.STORY_PATTERN.findall(text)
+        started = len(self.STORY_START_PATTERN.findall(text))
+        if started > len(stories):
+            malformed = [
+                line.strip() for line in text.splitlines()
+                if self.STORY_START_PATTERN.match(line) and not self.STORY_PATTERN.match(line)
+            ]
+            return False, (
+                "These stories do not follow the structure 'As a [type of user], I want [an action or feature] "
+                "so that [benefit/value]': " + " | ".join(malformed[:5])
+            )
+        if len(stories) < self.min_stories:
+            return False, (
+                f"Expected at least {self.min_stories} user stories written as 'As a [type of user], "
+                f"I want [an action or feature] so that [benefit/value]', found {len(stories)}."
+            )
+        if self.defer_on_pass:
+            return None
+        return True, f"All {len(stories)} user stories follow the required structure."
+
+
+class LabeledFieldsValidator:
+    """
+    Checks that a response is made of items that each carry every labeled field in fields,
+    e.g. "Task ID: T001" ... "Dependencies: None". A new item starts at each occurrence of the first field.
+    A field's value runs up to the next field label, so it may sit on the lines below its label (bulleted lists).
+    With defer_on_pass, well-formed responses are passed on to the LLM judge for any semantic criteria.
+    """
+    def __init__(self, fields, item_name="item", min_items=1, defer_on_pass=False):
+        self.fields = tuple(fields)
+        self.item_name = item_name
+        self.min_items = min_items
+        self.defer_on_pass = defer_on_pass
+        self._label_pattern = re.compile(
+            LINE_PREFIX + r"(?P<field>" + "|".join(re.escape(field) for field in self.fields) + r")[ \t]*:",
+            re.IGNORECASE | re.MULTILINE
+        )
+        self._item_start_pattern = re.compile(
+            LINE_PREFIX + re.escape(self.fields[0]) + r"[ \t]*:", re.IGNORECASE | re.MULTILINE
+        )
+
+    def split_items(self, response):
+        # Text of each item, from one occurrence of the first field to the next
+        text = _strip_emphasis(response)
+        starts = [match.start() for match in self._item_start_pattern.finditer(text)]
+        return [text[start:end] for start, end in zip(starts, starts[1:] + [len(text)])]
+
+    def field_values(self, item):
+        # {field: value} for every labeled field in an item; a value ends where the next label starts
+        labels = list(self._label_pattern.finditer(item))
+        values = {}
+        for label, following in zip(labels, labels[1:] + [None]):
+            field = next(f for f in self.fields if f.lower() == label.group("field").lower())
+            value = item[label.end():following.start() if following else len(item)].strip()
+            values[field] = values.get(field) or value
+        return values
+
+    def missing_fields(self, item):
+        # Fields that are absent from an item or have an empty value
+        values = self.field_values(item)
+        return [field for field in self.fields if not values.get(field)]
+
+    def __call__(self, response):
+        items = self.split_items(response)
+        if len(items) < self.min_items:
+            return False, (
+                f"Expected at least {self.min_items} {self.item_name}s, each starting with '{self.fields[0]}:' "
+                f"and including the labeled fields: {', '.join(self.fields)}."
+            )
+        problems = []
+        for number, item in enumerate(items, start=1):
+            missing = self.missing_fields(item)
+            if missing:
+                problems.append(f"{self.item_name} {number} is missing {', '.join(missing)}")
+        if problems:
+            return False, "Every " + self.item_name + " must include all labeled fields: " + "; ".join(problems) + "."
+        if self.defer_on_pass:
+            return None
+        return True, f"All {len(items)} {self.item_name}s include every required field."
@@ -1,197 +1,158 @@
 # Main workflow orchestration script for Email Router product development
-# Coordinates multiple specialized agents to generate a comprehensive project plan
+# Coordinates multiple specialized agents (through WorkflowEngine) to generate a comprehensive project plan
 
+import argparse
 import os
 from dotenv import load_dotenv
-from workflow_agents.base_agents import ActionPlanningAgent, KnowledgeAugmentedPromptAgent, EvaluationAgent, RoutingAgent
+from workflow_agents.budget import BudgetManager
+from workflow_agents.completion_cache import CompletionCache, SQLiteCacheBackend
+from workflow_agents.embedding_cache import EmbeddingCache
+from workflow_agents.instrumentation import TraceFileExporter
+from workflow_agents.llm_client import LLMClient
+from workflow_agents.request_scheduler import RequestScheduler
+from workflow_agents.routing_cache import RoutingCache
+from workflow_agents.workflow_engine import WorkflowEngine
+
+# Command line options
+parser = argparse.ArgumentParser(description="Generate a project plan for the Email Router product")
+parser.add_argument("--stream", action="store_true", help="print agent output token by token as it is generated")
+parser.add_argument("--trace", metavar="PATH", help="append one JSON line per LLM call to this file")
+parser.add_argument("--knowledge-tokens", type=int,
+                    help="send each prompt only the most relevant spec sections, up to this many tokens")
+parser.add_argument("--max-tokens", type=int, help="hard cap on tokens used by this run")
+parser.add_argument("--max-cost", type=float, help="hard cap on estimated USD cost of this run")
+parser.add_argument("--requests-per-minute", type=int, help="rate limit for LLM requests")
+parser.add_argument("--tokens-per-minute", type=int, help="rate limit for LLM tokens")
+parser.add_argument("--request-timeout", type=float, default=120.0, help="seconds before an LLM request is retried")
+parser.add_argument("--checkpoint", default=".workflow_checkpoint.json", metavar="PATH",
+                    help="file recording finished steps, so an interrupted run resumes where it stopped")
+parser.add_argument("--fresh", action="store_true",
+                    help="ignore existing checkpoints and cached completions and rerun every step")
+parser.add_argument("--no-cache", action="store_true", help="do not read or write the on-disk completion cache")
+args = parser.parse_args()
 
 # Setup environment and API credentials
+# Set LLM_BACKEND=mock to run the whole workflow offline against the deterministic local backend
 load_dotenv()
 
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
-# Load product specification document
-with open("Product-Spec-Email-Router.txt", "r") as f:
-    product_spec = f.read()
-
-# Instantiate agents
-# Action Planning Agent: breaks down high-level requests into discrete steps
-knowledge_action_planning = """You extract actionable steps from a user's request for technical project management. 
-For a request to create a full product development plan, you should extract steps like:
-1. Define user personas and user stories
-2. Define product features based on user stories
-3. Create detailed engineering tasks from features
-List each step on a new line, numbered."""
-
-action_planning_agent = ActionPlanningAgent(openai_api_key, knowledge_action_planning)
-
-# Product Manager Agent: defines user personas and user stories
-persona_product_manager = "a Product Manager responsible for defining user personas and creating user stories"
-
-knowledge_product_manager = """As a Product Manager, you define user personas and create user stories based on product specifications. 
-User stories should follow this structure: As a [type of user], I want [an action or feature] so that [benefit/value].
-Focus on understanding user needs and translating them into clear, actionable stories.
-
-Product Specification:
-""" + product_spec
-
-product_manager_knowledge_agent = KnowledgeAugmentedPromptAgent(openai_api_key, persona_product_manager, knowledge_product_manager)
-
-# Product Manager Evaluation Agent: validates user stories against required format
-product_manager_evaluation_agent = EvaluationAgent(
-    openai_api_key,
-    "You are an evaluation agent that checks the answers of other worker agents",
-    "The answer should be stories that follow the following structure: As a [type of user], I want [an action or feature] so that [benefit/value].",
-    product_manager_knowledge_agent
+# Completions are cached on disk for a week, so re-running against an unchanged spec reuses earlier answers;
+# a fresh run asks the model again and stores the new answers in their place
+completion_cache = None if args.no_cache else CompletionCache(
+    SQLiteCacheBackend(".completion_cache.sqlite"), ttl=7 * 24 * 3600, refresh=args.fresh
 )
 
-# Program Manager Agent: defines product features from user stories
-persona_program_manager = "a Program Manager responsible for defining product features"
-
-knowledge_program_manager = """As a Program Manager, you define product features based on user stories and product requirements.
-Features should be high-level capabilities that deliver value to users.
-Each feature should include: Feature Name, Description, Key Functionality, and User Benefit.
-
-Focus specifically on the Email Router product. Use the product specification below to guide your feature definitions.
-
-Product Specification:
-""" + product_spec
-
-program_manager_knowledge_agent = KnowledgeAugmentedPromptAgent(openai_api_key, persona_program_manager, knowledge_program_manager)
-
-persona_program_manager_eval = "You are an evaluation agent that checks program manager outputs"
+# Run budget: near the cap evaluation loops stop early and chat calls move to a cheaper model;
+# at the cap, remaining steps are skipped
+budget = BudgetManager(max_tokens=args.max_tokens, max_cost=args.max_cost)
+
+# Every request goes through one scheduler: at most 8 in flight, optional rate limits, embeddings ahead of
+# completions, and transient failures (429s, timeouts, 5xx) retried with exponential backoff
+scheduler = RequestScheduler(
+    max_concurrency=8,
+    requests_per_minute=args.requests_per_minute,
+    tokens_per_minute=args.tokens_per_minute,
+    max_retries=5,
+    timeout=args.request_timeout
+)
 
-# Program Manager Evaluation Agent: validates feature format
-program_manager_evaluation_agent = EvaluationAgent(
+# One pooled client for every agent: connections are reused across all agents
+llm_client = LLMClient(
     openai_api_key,
-    persona_program_manager_eval,
-    "The answer should be product features that follow the following structure: " \
-    "Feature Name: A clear, concise title that identifies the capability\n" \
-    "Description: A brief explanation of what the feature does and its purpose\n" \
-    "Key Functionality: The specific capabilities or actions the feature provides\n" \
-    "User Benefit: How this feature creates value for the user",
-    program_manager_knowledge_agent
+    max_connections=10,
+    max_keepalive_connections=10,
+    completion_cache=completion_cache,
+    budget=budget,
+    scheduler=scheduler
 )
 
-# Development Engineer Agent: creates detailed engineering tasks
-persona_dev_engineer = "a Development Engineer responsible for creating detailed technical tasks"
-
-knowledge_dev_engineer = """As a Development Engineer, you create detailed engineering tasks from features and user stories.
-Tasks must follow this EXACT format with ALL labeled fields:
+# Optional trace file with one JSON line per LLM call
+if args.trace:
+    llm_client.add_hook(TraceFileExporter(args.trace))
 
-Task ID: [unique identifier like T001, T002, etc.]
-Task Title: [brief task name]
-Related User Story: [reference to the user story this relates to]
-Description: [detailed technical work explanation]
-Acceptance Criteria: [specific completion requirements]
-Estimated Effort: [time or complexity estimate]
-Dependencies: [prerequisite tasks or 'None']
-
-Each task MUST include all seven labeled fields above.
+# Load product specification document
+with open("Product-Spec-Email-Router.txt", "r") as f:
+    product_spec = f.read()
 
-Focus specifically on the Email Router product. Use the product specification below to guide your task definitions.
+# Console output while the workflow runs
+# Streaming runs one step at a time so token output from different steps does not interleave
+def stream_to_console(label, tokens):
+    # Print tokens as they arrive and return the full text
+    # The heading waits for the first token, so a call the budget blocks prints nothing
+    parts = []
+    for token in tokens:
+        if not parts:
+            print("Planning:" if label == "plan" else "\nDraft:")
+        print(token, end="", flush=True)
+        parts.append(token)
+    print()
+    if label == "plan":
+        print()
+    return "".join(parts)
 
-Product Specification:
-""" + product_spec
+def print_plan(step_graph, resumed):
+    if resumed:
+        print(f"Resuming from {args.checkpoint} ({resumed} checkpointed results)")
+        print()
+    print("Workflow Steps Identified:")
+    for node in step_graph:
+        dependencies = ", ".join(str(index + 1) for index in node["depends_on"]) or "none"
+        print(f"  {node['index'] + 1}. {node['step']} (depends on: {dependencies})")
+    print()
+    print("=" * 100)
+    print()
 
-dev_engineer_knowledge_agent = KnowledgeAugmentedPromptAgent(openai_api_key, persona_dev_engineer, knowledge_dev_engineer)
+def print_step_header(node):
+    print(f"EXECUTING STEP {node['index'] + 1}: {node['step']}")
+    print("-" * 100)
 
-persona_dev_engineer_eval = "You are an evaluation agent that checks development engineer outputs"
+def print_step_result(node, record):
+    # Steps finish in dependency order, not necessarily in step order
+    # When streaming, the header and draft were already printed as the step ran
+    if not args.stream:
+        print_step_header(node)
+    if record["skipped"]:
+        print(f"\nSkipped: {record['skipped']}")
+    elif not args.stream:
+        print(f"\nResult:\n{record['output']}")
+    elif record["restored"]:
+        print(f"Restored from checkpoint (routed to {record['agent']}):\n{record['output']}")
+    elif record["output"] is not None and record["output"] != record.get("draft"):
+        print(f"\nRevised after {record['iterations']} evaluation iterations:\n{record['output']}")
+    print()
+    print("=" * 100)
+    print()
 
-# Development Engineer Evaluation Agent: validates task structure and completeness
-dev_engineer_evaluation_agent = EvaluationAgent(
-    openai_api_key,
-    persona_dev_engineer_eval,
-    "The answer should be tasks following this exact structure with labeled fields: " \
-    "Task ID: [unique identifier]\n" \
-    "Task Title: [brief task name]\n" \
-    "Related User Story: [reference to user story]\n" \
-    "Description: [detailed technical work explanation]\n" \
-    "Acceptance Criteria: [specific completion requirements]\n" \
-    "Estimated Effort: [time or complexity estimate]\n" \
-    "Dependencies: [prerequisite tasks or 'None']\n\n" \
-    "Each task must have ALL these labeled fields.",
-    dev_engineer_knowledge_agent
+# The workflow itself (roles, routing, evaluation, checkpoints) lives in WorkflowEngine
+# Embeddings and routing decisions are persisted so they are not recomputed on every run
+engine = WorkflowEngine(
+    llm_client,
+    embedding_cache=EmbeddingCache(cache_dir=".embedding_cache"),
+    max_parallel_steps=1 if args.stream else 4,
+    knowledge_tokens=args.knowledge_tokens,
+    routing_cache=RoutingCache(".routing_cache.json"),
+    on_plan=print_plan,
+    on_step_start=print_step_header if args.stream else None,
+    on_step_complete=print_step_result,
+    stream=stream_to_console if args.stream else None
 )
 
-# Routing Agent: directs steps to the appropriate specialized agent
-routing_agent = RoutingAgent(openai_api_key)
-
-# Support functions: wrap agent execution with evaluation
-def product_manager_support_function(query):
-    # Execute product manager agent and validate output
-    response = product_manager_knowledge_agent.respond(query)
-    result = product_manager_evaluation_agent.evaluate(query)
-    return result['final_response']
-
-def program_manager_support_function(query):
-    # Execute program manager agent and validate output
-    response = program_manager_knowledge_agent.respond(query)
-    result = program_manager_evaluation_agent.evaluate(query)
-    return result['final_response']
-
-def development_engineer_support_function(query):
-    # Execute development engineer agent and validate output
-    response = dev_engineer_knowledge_agent.respond(query)
-    result = dev_engineer_evaluation_agent.evaluate(query)
-    return result['final_response']
-
-# Register specialized agents with routing agent
-# Each agent has a description used for semantic matching with workflow steps
-routing_agent.agents = [
-    {
-        "name": "Product Manager",
-        "description": "Responsible for defining user personas and user stories for the Email Router product. Does not define features or tasks. Does not group stories.",
-        "func": lambda x: product_manager_support_function(x)
-    },
-    {
-        "name": "Program Manager",
-        "description": "Responsible for defining Email Router product features and capabilities based on user stories. Does not create user stories or engineering tasks.",
-        "func": lambda x: program_manager_support_function(x)
-    },
-    {
-        "name": "Development Engineer",
-        "description": "Responsible for creating detailed engineering tasks and technical implementation plans for the Email Router product. Does not create user stories or features.",
-        "func": lambda x: development_engineer_support_function(x)
-    }
-]
-
-# Main workflow prompt defining the overall goal
-workflow_prompt = """Create a comprehensive product development plan for the Email Router product. 
-This should include: user stories for different user types, product features that fulfill those stories, 
-and detailed engineering tasks to implement those features."""
-
 print("=" * 100)
 print("AGENTIC WORKFLOW FOR EMAIL ROUTER PRODUCT DEVELOPMENT")
 print("=" * 100)
 print()
 
-# Generate workflow steps from high-level prompt
-workflow_steps = action_planning_agent.extract_steps_from_prompt(workflow_prompt)
-
-print("Workflow Steps Identified:")
-for i, step in enumerate(workflow_steps, 1):
-    print(f"  {i}. {step}")
-print()
-print("=" * 100)
-print()
-
-# Execute each workflow step
-completed_steps = []
-step_descriptions = []
-
-for i, step in enumerate(workflow_steps, 1):
-    print(f"EXECUTING STEP {i}: {step}")
-    print("-" * 100)
-    
-    # Route step to appropriate agent based on semantic similarity
-    result = routing_agent.route(step)
-    completed_steps.append(result)
-    step_descriptions.append(step)
-    
-    print(f"\nResult:\n{result}")
-    print()
-    print("=" * 100)
+# Every finished step is checkpointed, so a rerun skips steps whose input is unchanged
+result = engine.run(
+    product_spec,
+    name="email-router",
+    product="Email Router",
+    checkpoint_path=args.checkpoint,
+    fresh=args.fresh
+)
+if result["status"] != "ok":
+    print(f"Workflow failed: {result['error']}")
     print()
 
 # Consolidate final deliverable with all components
@@ -201,50 +162,38 @@ print()
 print("COMPREHENSIVE PROJECT PLAN FOR EMAIL ROUTER")
 print()
 
-# Extract and organize results by type
-# Check both step description and result content for accurate categorization
-user_stories = []
-product_features = []
-engineering_tasks = []
-
-for i, (step_desc, result) in enumerate(zip(step_descriptions, completed_steps)):
-    if result:
-        step_lower = step_desc.lower()
-        result_lower = result.lower()
-        
-        # Identify user story steps by checking for user story patterns
-        if ("user stor" in step_lower or "persona" in step_lower) and "as a" in result_lower:
-            user_stories.append(result)
-        # Identify feature steps by checking for feature patterns
-        elif "feature" in step_lower and ("feature name:" in result_lower or "key functionality:" in result_lower):
-            product_features.append(result)
-        # Identify task steps by checking for task patterns
-        elif ("task" in step_lower or "engineering" in step_lower) and "task id:" in result_lower:
-            engineering_tasks.append(result)
-
-# Print consolidated output
-if user_stories:
-    print("=" * 100)
-    print("USER STORIES")
-    print("=" * 100)
-    for story in user_stories:
-        print(story)
-        print()
+# Outputs are grouped by step wording and output structure
+for title, key in (("USER STORIES", "user_stories"), ("PRODUCT FEATURES", "product_features"),
+                   ("ENGINEERING TASKS", "engineering_tasks")):
+    if result[key]:
+        print("=" * 100)
+        print(title)
+        print("=" * 100)
+        for output in result[key]:
+            print(output)
+            print()
 
-if product_features:
-    print("=" * 100)
-    print("PRODUCT FEATURES")
-    print("=" * 100)
-    for feature in product_features:
-        print(feature)
-        print()
+print("=" * 100)
 
-if engineering_tasks:
-    print("=" * 100)
-    print("ENGINEERING TASKS")
-    print("=" * 100)
-    for task in engineering_tasks:
-        print(task)
-        print()
+# Report where LLM calls and tokens went during this run
+print()
+print("LLM USAGE BY STEP")
+print("=" * 100)
+print(engine.call_stats.format_report(group_by="step"))
+print("=" * 100)
 
+# Token and estimated cost totals per agent for this run
+print()
+print("TOKEN BUDGET BY AGENT")
 print("=" * 100)
+print(budget.format_report(group_by="agent"))
+print("=" * 100)
+
+# Which routing tier decided each step: cached decisions, local keyword scores, embeddings or an LLM tie-break
+if result["routing"]:
+    print()
+    print("ROUTING TIERS")
+    print("=" * 100)
+    for tier, tier_stats in result["routing"]["tiers"].items():
+        print(f"{tier:<20}{tier_stats['hits']:>10}{tier_stats['share']:>10.0%}")
+    print("=" * 100)
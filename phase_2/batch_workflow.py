@@ -0,0 +1,89 @@
+# Batch runner: plans many products in one process
+# Reads a directory of spec files or a JSONL file of specs and runs the workflow for each of them concurrently,
+# sharing one LLM client (connection pool, rate limits, retries), the completion cache and the embedding cache
+
+import argparse
+import json
+import os
+from dotenv import load_dotenv
+from workflow_agents.completion_cache import CompletionCache, SQLiteCacheBackend
+from workflow_agents.embedding_cache import EmbeddingCache
+from workflow_agents.llm_client import LLMClient
+from workflow_agents.request_scheduler import RequestScheduler
+from workflow_agents.routing_cache import RoutingCache
+from workflow_agents.workflow_engine import WorkflowEngine, load_specs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate project plans for many product specs")
+    parser.add_argument("specs", help="directory of .txt/.md spec files, or a JSONL file of specs")
+    parser.add_argument("--output-dir", default="batch_results", help="directory for one JSON result per spec")
+    parser.add_argument("--max-workflows", type=int, default=4, help="specs processed at the same time")
+    parser.add_argument("--max-parallel-steps", type=int, default=4, help="independent steps run at once per spec")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="LLM requests in flight across all specs")
+    parser.add_argument("--requests-per-minute", type=int, help="rate limit for LLM requests")
+    parser.add_argument("--tokens-per-minute", type=int, help="rate limit for LLM tokens")
+    parser.add_argument("--request-timeout", type=float, default=120.0, help="seconds before an LLM request is retried")
+    parser.add_argument("--knowledge-tokens", type=int,
+                        help="send each prompt only the most relevant spec sections, up to this many tokens")
+    parser.add_argument("--checkpoint-dir", help="directory of per-spec checkpoints, so reruns skip finished steps")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the on-disk completion cache")
+    args = parser.parse_args()
+
+    # Set LLM_BACKEND=mock to run offline against the deterministic local backend
+    load_dotenv()
+
+    specs = load_specs(args.specs)
+    if not specs:
+        parser.error(f"no specs found in {args.specs}")
+
+    # Shared by every workflow in the batch
+    scheduler = RequestScheduler(
+        max_concurrency=args.max_concurrency,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        max_retries=5,
+        timeout=args.request_timeout
+    )
+    client = LLMClient(
+        os.getenv("OPENAI_API_KEY"),
+        max_connections=args.max_concurrency,
+        max_keepalive_connections=args.max_concurrency,
+        completion_cache=None if args.no_cache else CompletionCache(
+            SQLiteCacheBackend(".completion_cache.sqlite"), ttl=7 * 24 * 3600
+        ),
+        scheduler=scheduler
+    )
+    engine = WorkflowEngine(
+        client,
+        embedding_cache=EmbeddingCache(cache_dir=".embedding_cache"),
+        max_parallel_steps=args.max_parallel_steps,
+        knowledge_tokens=args.knowledge_tokens,
+        checkpoint_dir=args.checkpoint_dir,
+        routing_cache=RoutingCache(".routing_cache.json")
+    )
+
+    print(f"Running {len(specs)} specs, {args.max_workflows} at a time")
+
+    def report(result):
+        status = "ok" if result["status"] == "ok" else f"FAILED ({result['error']})"
+        print(f"  {result['name']}: {status} in {result['seconds']:.1f}s, "
+              f"{len(result['user_stories'])} story sets, {len(result['product_features'])} feature sets, "
+              f"{len(result['engineering_tasks'])} task sets")
+
+    _, stats = engine.run_many(
+        specs, max_workflows=args.max_workflows, output_dir=args.output_dir, on_result=report,
+        reserved_names=("summary",)
+    )
+    stats["scheduler"] = scheduler.stats()
+    with open(os.path.join(args.output_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2)
+
+    print(f"{stats['succeeded']}/{stats['specs']} specs succeeded in {stats['seconds']:.1f}s "
+          f"({stats['specs_per_hour']:.0f} specs/hour)")
+    print(f"Results written to {args.output_dir}")
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
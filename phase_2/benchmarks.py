@@ -0,0 +1,283 @@
+# Benchmark suite for the agent pipeline
+# Runs against the deterministic MockBackend so results measure framework overhead plus simulated latency,
+# and writes a JSON report that can be compared release over release
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import runpy
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from workflow_agents.backends import MockBackend
+from workflow_agents.base_agents import EvaluationAgent, KnowledgeAugmentedPromptAgent, RAGKnowledgePromptAgent, RoutingAgent
+from workflow_agents.embedding_cache import EmbeddingCache
+from workflow_agents.llm_client import LLMClient
+from workflow_agents.vector_index import IVFVectorIndex
+
+WORKFLOW_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def summarize(latencies):
+    # Latency distribution in milliseconds
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "mean_ms": 1000 * statistics.fmean(ordered),
+        "p50_ms": 1000 * ordered[len(ordered) // 2],
+        "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "max_ms": 1000 * ordered[-1]
+    }
+
+
+def timed(func, repeats):
+    # Call func repeatedly and return (latencies, total seconds)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeats):
+        call_start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_start)
+    return latencies, time.perf_counter() - start
+
+
+def make_client(args, rules=None):
+    return LLMClient(backend=MockBackend(rules=rules, latency=args.latency, seed=args.seed))
+
+
+def semantic_routing(args, agents, prompts, bulk):
+    # Route prompts on embeddings alone (no lexical tier), one at a time or with select_agents
+    client = make_client(args)
+    router = RoutingAgent(None, embedding_cache=EmbeddingCache(), client=client, lexical_margin=None)
+    router.register_agents(agents)
+    start = time.perf_counter()
+    if bulk:
+        router.select_agents(prompts)
+    else:
+        for prompt in prompts:
+            router.select_agent(prompt)
+    return time.perf_counter() - start, client.backend.stats()["embedding_calls"]
+
+
+def benchmark_routing(args):
+    # Registration cost, per-route latency and bulk routing for a growing number of specialist agents
+    results = []
+    for agent_count in args.agent_counts:
+        client = make_client(args)
+        router = RoutingAgent(None, embedding_cache=EmbeddingCache(), client=client)
+        agents = [
+            {"name": f"agent-{i}", "description": f"Specialist {i} for topic {i} and area {i % 7}", "func": lambda x: x}
+            for i in range(agent_count)
+        ]
+        start = time.perf_counter()
+        router.register_agents(agents)
+        registration_seconds = time.perf_counter() - start
+        before = client.backend.stats()
+        prompts = [f"Question about topic {i % agent_count} number {i}" for i in range(args.repeats)]
+        prompt_iter = iter(prompts)
+        latencies, total = timed(lambda: router.route(next(prompt_iter)), args.repeats)
+        after = client.backend.stats()
+        rank_latencies, _ = timed(lambda: router.rank(prompts[0]), args.repeats)
+        single_seconds, single_requests = semantic_routing(args, agents, prompts, bulk=False)
+        bulk_seconds, bulk_requests = semantic_routing(args, agents, prompts, bulk=True)
+        results.append({
+            "agents": agent_count,
+            "registration_ms": 1000 * registration_seconds,
+            "route_latency": summarize(latencies),
+            "routes_per_second": args.repeats / total,
+            "embedding_requests_per_route": (after["embedding_calls"] - before["embedding_calls"]) / args.repeats,
+            "routing_tiers": {tier: stats["hits"] for tier, stats in router.stats()["tiers"].items()},
+            "rank_latency": summarize(rank_latencies),
+            "semantic_routing": {
+                "one_at_a_time_ms": 1000 * single_seconds,
+                "bulk_ms": 1000 * bulk_seconds,
+                "one_at_a_time_embedding_requests": single_requests,
+                "bulk_embedding_requests": bulk_requests,
+                "bulk_speedup": single_seconds / bulk_seconds if bulk_seconds > 0 else None
+            }
+        })
+    return results
+
+
+def benchmark_rag_retrieval(args):
+    # Index build time and retrieval latency for exact and IVF indexes at several corpus sizes
+    results = []
+    for corpus_size in args.corpus_sizes:
+        documents = [f"Document {i} describes component {i % 97} of subsystem {i % 13}" for i in range(corpus_size)]
+        for mode in ("flat", "ivf"):
+            client = make_client(args)
+            index = IVFVectorIndex(n_lists=max(1, int(corpus_size ** 0.5)), n_probe=4) if mode == "ivf" else None
+            start = time.perf_counter()
+            agent = RAGKnowledgePromptAgent(None, "a benchmark", documents, embedding_cache=EmbeddingCache(),
+                                            index=index, client=client)
+            build_seconds = time.perf_counter() - start
+            build_stats = client.backend.stats()
+            prompts = iter([f"component {i % 97} subsystem {i % 13}" for i in range(args.repeats)])
+            latencies, total = timed(lambda: agent.retrieve_relevant_knowledge(next(prompts), top_k=5), args.repeats)
+            results.append({
+                "documents": corpus_size,
+                "index": mode,
+                "build_ms": 1000 * build_seconds,
+                "build_embedding_requests": build_stats["embedding_calls"],
+                "retrieve_latency": summarize(latencies),
+                "retrievals_per_second": args.repeats / total
+            })
+    return results
+
+
+def benchmark_evaluation(args):
+    # Evaluation loops that never pass, so each run uses every allowed iteration
+    rules = [
+        (r"Evaluate the following response", (
+            '{"verdict": "fail", "score": 3, "reason": "The response does not meet the criteria.", '
+            '"correction": "Add more detail."}'
+        ))
+    ]
+    results = []
+    for max_interactions in args.max_interactions:
+        client = make_client(args, rules=rules)
+        worker = KnowledgeAugmentedPromptAgent(None, "a benchmark worker", "Benchmark knowledge.", client=client)
+        evaluator = EvaluationAgent(None, "an evaluator", "The answer must be perfect.", worker,
+                                    max_interactions=max_interactions, client=client)
+        latencies, total = timed(lambda: evaluator.evaluate("Describe the product."), args.repeats)
+        stats = client.backend.stats()
+        results.append({
+            "max_interactions": max_interactions,
+            "evaluate_latency": summarize(latencies),
+            "chat_requests_per_evaluation": stats["chat_calls"] / args.repeats,
+            "tokens_per_evaluation": (stats["prompt_tokens"] + stats["completion_tokens"]) / args.repeats
+        })
+    return results
+
+
+def benchmark_workflow(args):
+    # Full Email Router workflow, run in a scratch directory so on-disk caches start cold
+    latencies = []
+    stats = []
+    os.environ["LLM_BACKEND"] = "mock"
+    os.environ["MOCK_LLM_LATENCY"] = str(args.latency)
+    original_cwd, original_argv = os.getcwd(), sys.argv
+    try:
+        for _ in range(args.workflow_runs):
+            with tempfile.TemporaryDirectory() as scratch:
+                shutil.copy(os.path.join(WORKFLOW_DIR, "Product-Spec-Email-Router.txt"), scratch)
+                os.chdir(scratch)
+                sys.argv = ["agentic_workflow.py"]
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    workflow_globals = runpy.run_path(os.path.join(WORKFLOW_DIR, "agentic_workflow.py"), run_name="__main__")
+                latencies.append(time.perf_counter() - start)
+                stats.append(workflow_globals["llm_client"].backend.stats())
+                os.chdir(original_cwd)
+    finally:
+        os.chdir(original_cwd)
+        sys.argv = original_argv
+    return {
+        "runs": args.workflow_runs,
+        "latency": summarize(latencies),
+        "chat_requests": statistics.fmean(s["chat_calls"] for s in stats),
+        "embedding_requests": statistics.fmean(s["embedding_calls"] for s in stats),
+        "tokens": statistics.fmean(s["prompt_tokens"] + s["completion_tokens"] for s in stats),
+        "workflows_per_hour": 3600 * len(latencies) / sum(latencies)
+    }
+
+
+# Python snippets timed in fresh interpreters; each prints which heavy modules it ended up importing
+STARTUP_SNIPPETS = {
+    "import_base_agents": "import workflow_agents.base_agents",
+    "construct_agents": (
+        "from workflow_agents.base_agents import DirectPromptAgent, EvaluationAgent, KnowledgeAugmentedPromptAgent\n"
+        "worker = KnowledgeAugmentedPromptAgent('key', 'a worker', 'Some knowledge.')\n"
+        "EvaluationAgent('key', 'an evaluator', 'criteria', worker)\n"
+        "DirectPromptAgent('key')"
+    ),
+    "workflow_cli_help": "import runpy, sys\nsys.argv = ['agentic_workflow.py', '--help']\n"
+                         "try:\n    runpy.run_path('agentic_workflow.py', run_name='__main__')\nexcept SystemExit:\n    pass"
+}
+STARTUP_REPORT = "\nimport sys\nprint(','.join(m for m in ('numpy', 'openai', 'httpx') if m in sys.modules), file=sys.stderr)"
+
+
+def benchmark_startup(args):
+    # Wall time of fresh interpreters importing and constructing agents, against the startup target
+    results = []
+    baseline_latencies = []
+    for _ in range(args.startup_runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        baseline_latencies.append(time.perf_counter() - start)
+    baseline = summarize(baseline_latencies)
+    for name, snippet in STARTUP_SNIPPETS.items():
+        latencies = []
+        for _ in range(args.startup_runs):
+            start = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, "-c", snippet + STARTUP_REPORT], cwd=WORKFLOW_DIR,
+                check=True, capture_output=True, text=True
+            )
+            latencies.append(time.perf_counter() - start)
+        latency = summarize(latencies)
+        overhead_ms = latency["p50_ms"] - baseline["p50_ms"]
+        results.append({
+            "scenario": name,
+            "latency": latency,
+            "overhead_ms": overhead_ms,
+            "heavy_modules_loaded": [m for m in completed.stderr.rstrip("\n").rpartition("\n")[2].split(",") if m],
+            "target_ms": args.startup_target_ms,
+            "meets_target": overhead_ms <= args.startup_target_ms
+        })
+    return {"interpreter_baseline": baseline, "scenarios": results}
+
+
+BENCHMARKS = {
+    "startup": benchmark_startup,
+    "routing": benchmark_routing,
+    "rag_retrieval": benchmark_rag_retrieval,
+    "evaluation": benchmark_evaluation,
+    "workflow": benchmark_workflow
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agent pipeline against the mock backend")
+    parser.add_argument("--output", default="benchmark_results.json", help="path of the JSON report")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per backend request")
+    parser.add_argument("--repeats", type=int, default=50, help="measured calls per configuration")
+    parser.add_argument("--agent-counts", type=int, nargs="+", default=[3, 30, 100])
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--max-interactions", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--workflow-runs", type=int, default=3)
+    parser.add_argument("--startup-runs", type=int, default=10, help="fresh interpreters per startup scenario")
+    parser.add_argument("--startup-target-ms", type=float, default=150.0,
+                        help="allowed startup time on top of a bare interpreter")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": {}
+    }
+    for name in args.only or BENCHMARKS:
+        print(f"Running {name} benchmark...")
+        start = time.perf_counter()
+        report["results"][name] = BENCHMARKS[name](args)
+        print(f"  done in {time.perf_counter() - start:.2f}s")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+# LLM backends used by LLMClient
+# OpenAIBackend talks to an OpenAI-compatible endpoint; MockBackend is a deterministic offline stand-in
+
+import asyncio
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+
+OPENAI_BASE_URL = "https://openai.vocareum.com/v1"
+
+
+def estimate_tokens(text):
+    # Rough token count (about four characters per token) used where the backend reports no usage
+    return max(1, len(text) // 4) if text else 0
+
+
+class OpenAIBackend:
+    """
+    Backend for OpenAI-compatible APIs with pooled keep-alive HTTP connections.
+    Backends return (content, usage) from chat calls and (embeddings, usage) from embedding calls,
+    where usage holds prompt/completion token counts; streaming calls yield text deltas only.
+    Every call accepts a per-request timeout in seconds. The SDK's own retries are disabled,
+    since LLMClient retries through its RequestScheduler.
+    """
+    def __init__(self, api_key, base_url=OPENAI_BASE_URL, max_connections=20, max_keepalive_connections=10,
+                 keepalive_expiry=30.0, timeout=60.0):
+        import httpx
+        from openai import OpenAI
+
+        self.api_key = api_key
+        self.base_url = base_url
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self._timeout = timeout
+        self.sync_client = OpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            max_retries=0,
+            http_client=httpx.Client(limits=self._limits, timeout=timeout)
+        )
+        self._async_client = None
+
+    @property
+    def async_client(self):
+        # Created on first async use so purely synchronous programs never open an async pool
+        if self._async_client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            self._async_client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=self.api_key,
+                max_retries=0,
+                http_client=httpx.AsyncClient(limits=self._limits, timeout=self._timeout)
+            )
+        return self._async_client
+
+    @staticmethod
+    def _usage(response):
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return {}
+        return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": getattr(usage, "completion_tokens", 0) or 0}
+
+    @staticmethod
+    def _ordered_embeddings(response):
+        # The API tags each vector with its input position; restore input order explicitly
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    @staticmethod
+    def _delta(chunk):
+        return chunk.choices[0].delta.content if chunk.choices else None
+
+    @staticmethod
+    def _request_options(timeout):
+        # Only override the client-wide timeout when a per-call timeout is given
+        return {} if timeout is None else {"timeout": timeout}
+
+    def chat(self, model, messages, timeout=None, **params):
+        response = self.sync_client.chat.completions.create(
+            model=model, messages=messages, **self._request_options(timeout), **params)
+        return response.choices[0].message.content, self._usage(response)
+
+    async def chat_async(self, model, messages, timeout=None, **params):
+        response = await self.async_client.chat.completions.create(
+            model=model, messages=messages, **self._request_options(timeout), **params)
+        return response.choices[0].message.content, self._usage(response)
+
+    def chat_stream(self, model, messages, timeout=None, **params):
+        stream = self.sync_client.chat.completions.create(
+            model=model, messages=messages, stream=True, **self._request_options(timeout), **params)
+        for chunk in stream:
+            delta = self._delta(chunk)
+            if delta:
+                yield delta
+
+    async def chat_stream_async(self, model, messages, timeout=None, **params):
+        stream = await self.async_client.chat.completions.create(
+            model=model, messages=messages, stream=True, **self._request_options(timeout), **params)
+        async for chunk in stream:
+            delta = self._delta(chunk)
+            if delta:
+                yield delta
+
+    def embed(self, model, texts, timeout=None):
+        response = self.sync_client.embeddings.create(model=model, input=texts, **self._request_options(timeout))
+        return self._ordered_embeddings(response), self._usage(response)
+
+    async def embed_async(self, model, texts, timeout=None):
+        response = await self.async_client.embeddings.create(model=model, input=texts, **self._request_options(timeout))
+        return self._ordered_embeddings(response), self._usage(response)
+
+    def close(self):
+        self.sync_client.close()
+
+    async def close_async(self):
+        self.sync_client.close()
+        if self._async_client is not None:
+            await self._async_client.close()
+
+
+class SimulatedBackendError(Exception):
+    """
+    Transient failure injected by MockBackend to exercise error handling.
+    Carries an HTTP-style status_code (503 by default) so it is retried like a real server error.
+    """
+    def __init__(self, message, status_code=503):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _first_listed_agent(messages):
+    # Routing tie-breaks get the first agent offered
+    match = re.search(r"^- ([^:\n]+):", messages[-1]["content"], re.MULTILINE)
+    return match.group(1) if match else ""
+
+
+# Canned answers for the prompts used by this project's agents, checked in order
+# Each rule is (pattern matched against the system + user messages, response or callable(messages))
+DEFAULT_MOCK_RULES = [
+    (r"You are a Routing Agent", _first_listed_agent),
+    (r"Evaluate the following response", (
+        '{"verdict": "pass", "score": 9, "reason": "The response meets the criteria.", "correction": ""}'
+    )),
+    (r"did not meet the criteria", "Rewrite the response so that it follows the required structure exactly."),
+    (r"Action Planning Agent", (
+        "1. Define user personas and user stories (depends on: none)\n"
+        "2. Define product features based on user stories (depends on: 1)\n"
+        "3. Create detailed engineering tasks from features (depends on: 2)"
+    )),
+    (r"Product Manager", (
+        "As an email administrator, I want to configure routing rules so that incoming emails reach the right team.\n"
+        "As a customer support agent, I want to receive only relevant emails so that I can respond faster."
+    )),
+    (r"Program Manager", (
+        "Feature Name: Automated Routing\n"
+        "Description: Routes incoming emails to the right team.\n"
+        "Key Functionality: Rule-based and skill-based routing.\n"
+        "User Benefit: Emails reach the right people without manual triage."
+    )),
+    (r"Development Engineer", (
+        "Task ID: T001\n"
+        "Task Title: Implement routing rules engine\n"
+        "Related User Story: Email administrator configures routing rules\n"
+        "Description: Build the service that evaluates routing rules for each email.\n"
+        "Acceptance Criteria: Emails matching a rule are delivered to the configured team.\n"
+        "Estimated Effort: 5 days\n"
+        "Dependencies: None"
+    ))
+]
+
+
+class MockBackend:
+    """
+    Deterministic local backend for offline runs and benchmarks.
+    Chat responses come from regex rules (first match wins, otherwise an echo of the prompt),
+    embeddings are hash-derived bag-of-words vectors so similar texts get similar vectors,
+    and latency and failure rate can be configured to simulate a remote service.
+    A request whose simulated latency exceeds its timeout raises TimeoutError after waiting the timeout.
+    """
+    def __init__(self, rules=None, dimensions=256, latency=0.0, latency_jitter=0.0, stream_chunk_delay=0.0,
+                 failure_rate=0.0, seed=0):
+        self.rules = [(re.compile(pattern, re.IGNORECASE), response)
+                      for pattern, response in (DEFAULT_MOCK_RULES if rules is None else rules)]
+        self.dimensions = dimensions
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.stream_chunk_delay = stream_chunk_delay
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat_calls = 0
+        self.embedding_calls = 0
+        self.embedded_texts = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def _next_delay_and_failure(self):
+        with self._lock:
+            delay = self.latency + (self._random.uniform(-1, 1) * self.latency_jitter if self.latency_jitter else 0.0)
+            failed = self.failure_rate > 0 and self._random.random() < self.failure_rate
+        return max(0.0, delay), failed
+
+    def _simulate(self, timeout=None):
+        delay, failed = self._next_delay_and_failure()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Simulated request timed out after {timeout}s")
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise SimulatedBackendError("Simulated backend failure")
+
+    async def _simulate_async(self, timeout=None):
+        delay, failed = self._next_delay_and_failure()
+        if timeout is not None and delay > timeout:
+            await asyncio.sleep(timeout)
+            raise TimeoutError(f"Simulated request timed out after {timeout}s")
+        if delay:
+            await asyncio.sleep(delay)
+        if failed:
+            raise SimulatedBackendError("Simulated backend failure")
+
+    def complete(self, messages):
+        # Pick the canned response for a conversation without simulating latency
+        text = "\n".join(message["content"] for message in messages)
+        for pattern, response in self.rules:
+            if pattern.search(text):
+                return response(messages) if callable(response) else response
+        return f"Mock response to: {messages[-1]['content'][:200]}"
+
+    def _chat_result(self, messages):
+        content = self.complete(messages)
+        usage = {
+            "prompt_tokens": sum(estimate_tokens(message["content"]) for message in messages),
+            "completion_tokens": estimate_tokens(content)
+        }
+        with self._lock:
+            self.chat_calls += 1
+            self.prompt_tokens += usage["prompt_tokens"]
+            self.completion_tokens += usage["completion_tokens"]
+        return content, usage
+
+    def embed_text(self, text):
+        # Signed feature hashing of lower-cased words into a unit vector
+        import numpy as np
+
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = 1.0
+            norm = 1.0
+        return (vector / norm).tolist()
+
+    def _embed_result(self, texts):
+        with self._lock:
+            self.embedding_calls += 1
+            self.embedded_texts += len(texts)
+        usage = {"prompt_tokens": sum(estimate_tokens(text) for text in texts), "completion_tokens": 0}
+        return [self.embed_text(text) for text in texts], usage
+
+    def chat(self, model, messages, timeout=None, **params):
+        self._simulate(timeout)
+        return self._chat_result(messages)
+
+    async def chat_async(self, model, messages, timeout=None, **params):
+        await self._simulate_async(timeout)
+        return self._chat_result(messages)
+
+    def chat_stream(self, model, messages, timeout=None, **params):
+        self._simulate(timeout)
+        content, _ = self._chat_result(messages)
+        for token in re.findall(r"\S+\s*", content):
+            if self.stream_chunk_delay:
+                time.sleep(self.stream_chunk_delay)
+            yield token
+
+    async def chat_stream_async(self, model, messages, timeout=None, **params):
+        await self._simulate_async(timeout)
+        content, _ = self._chat_result(messages)
+        for token in re.findall(r"\S+\s*", content):
+            if self.stream_chunk_delay:
+                await asyncio.sleep(self.stream_chunk_delay)
+            yield token
+
+    def embed(self, model, texts, timeout=None):
+        self._simulate(timeout)
+        return self._embed_result(texts)
+
+    async def embed_async(self, model, texts, timeout=None):
+        await self._simulate_async(timeout)
+        return self._embed_result(texts)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "chat_calls": self.chat_calls,
+                "embedding_calls": self.embedding_calls,
+                "embedded_texts": self.embedded_texts,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens
+            }
+
+    def close(self):
+        pass
+
+    async def close_async(self):
+        pass
+
+
+def create_backend(api_key=None, base_url=None, **options):
+    """
+    Build the backend selected by the LLM_BACKEND environment variable ("openai" by default, or "mock").
+    The mock backend reads MOCK_LLM_LATENCY, MOCK_LLM_FAILURE_RATE and MOCK_LLM_SEED.
+    """
+    name = os.getenv("LLM_BACKEND", "openai").lower()
+    if name == "mock":
+        return MockBackend(
+            latency=float(os.getenv("MOCK_LLM_LATENCY", "0")),
+            failure_rate=float(os.getenv("MOCK_LLM_FAILURE_RATE", "0")),
+            seed=int(os.getenv("MOCK_LLM_SEED", "0"))
+        )
+    if name == "openai":
+        return OpenAIBackend(api_key, base_url=base_url or os.getenv("OPENAI_BASE_URL", OPENAI_BASE_URL), **options)
+    raise ValueError(f"Unknown LLM_BACKEND: {name}")
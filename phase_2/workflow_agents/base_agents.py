@@ -1,8 +1,20 @@
 # Base agent implementations for agentic workflow system
 # Provides different types of agents with varying levels of knowledge augmentation and evaluation
+# Every agent offers a blocking API and an asyncio-native *_async counterpart
+# Agents share one pooled LLMClient per API key unless a client is injected
+# Heavy dependencies (numpy via the vector index, the OpenAI SDK via the client's backend) load on first use
 
-from openai import OpenAI
-import numpy as np
+import asyncio
+import inspect
+import json
+import re
+import threading
+
+from .backends import estimate_tokens
+from .chunking import chunk_document
+from .embedding_cache import get_default_embedding_cache
+from .llm_client import EMBEDDING_BATCH_SIZE, get_shared_client
+from .routing_cache import RoutingCache
 
 
 class DirectPromptAgent:
@@ -10,22 +22,29 @@ class DirectPromptAgent:
     Basic agent that sends prompts directly to the LLM without modification.
     Uses only the model's built-in knowledge.
     """
-    def __init__(self, openai_api_key):
+    def __init__(self, openai_api_key, client=None):
         self.openai_api_key = openai_api_key
-        self.client = OpenAI(
-            base_url="https://openai.vocareum.com/v1",
-            api_key=self.openai_api_key
-        )
-    
-    def respond(self, prompt):
+        self.client = client or get_shared_client(self.openai_api_key)
+
+    def build_messages(self, prompt):
         # Send prompt to LLM without any modifications
-        response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response.choices[0].message.content
+        return [
+            {"role": "user", "content": prompt}
+        ]
+
+    def respond(self, prompt):
+        return self.client.chat(self.build_messages(prompt), agent=type(self).__name__)
+
+    async def respond_async(self, prompt):
+        return await self.client.chat_async(self.build_messages(prompt), agent=type(self).__name__)
+
+    def respond_stream(self, prompt):
+        # Yield the response text as it is generated
+        yield from self.client.chat_stream(self.build_messages(prompt), agent=type(self).__name__)
+
+    async def respond_stream_async(self, prompt):
+        async for token in self.client.chat_stream_async(self.build_messages(prompt), agent=type(self).__name__):
+            yield token
 
 
 class AugmentedPromptAgent:
@@ -33,243 +52,850 @@ class AugmentedPromptAgent:
     Agent that uses a persona to shape response tone and style.
     Still relies on the LLM's general knowledge but with persona-specific framing.
     """
-    def __init__(self, openai_api_key, persona):
+    def __init__(self, openai_api_key, persona, client=None):
         self.openai_api_key = openai_api_key
         self.persona = persona
-        self.client = OpenAI(
-            base_url="https://openai.vocareum.com/v1",
-            api_key=self.openai_api_key
-        )
-    
-    def respond(self, prompt):
+        self.client = client or get_shared_client(self.openai_api_key)
+
+    def build_messages(self, prompt):
         # Apply persona as system message to shape response style
-        response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": f"You are {self.persona}. Forget all previous context."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response.choices[0].message.content
+        return [
+            {"role": "system", "content": f"You are {self.persona}. Forget all previous context."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def respond(self, prompt):
+        return self.client.chat(self.build_messages(prompt), agent=type(self).__name__)
+
+    async def respond_async(self, prompt):
+        return await self.client.chat_async(self.build_messages(prompt), agent=type(self).__name__)
+
+    def respond_stream(self, prompt):
+        # Yield the response text as it is generated
+        yield from self.client.chat_stream(self.build_messages(prompt), agent=type(self).__name__)
+
+    async def respond_stream_async(self, prompt):
+        async for token in self.client.chat_stream_async(self.build_messages(prompt), agent=type(self).__name__):
+            yield token
 
 
 class KnowledgeAugmentedPromptAgent:
     """
     Agent that uses specific knowledge and a persona to generate responses.
     Explicitly instructed to rely on provided knowledge rather than general LLM knowledge.
+    With max_knowledge_tokens set, the knowledge is split into heading-aware chunks of about chunk_tokens and
+    embedded once; each prompt then gets only its most relevant chunks (in their original order)
+    within that token budget. pinned_knowledge, such as answer-format instructions, is always sent in full.
     """
-    def __init__(self, openai_api_key, persona, knowledge):
+    def __init__(self, openai_api_key, persona, knowledge, client=None, max_knowledge_tokens=None,
+                 pinned_knowledge="", chunk_tokens=200, embedding_cache=None):
         self.openai_api_key = openai_api_key
         self.persona = persona
         self.knowledge = knowledge
-        self.client = OpenAI(
-            base_url="https://openai.vocareum.com/v1",
-            api_key=self.openai_api_key
+        self.client = client or get_shared_client(self.openai_api_key)
+        self.max_knowledge_tokens = max_knowledge_tokens
+        self.pinned_knowledge = pinned_knowledge
+        self.chunk_tokens = chunk_tokens
+        self.embedding_cache = embedding_cache or get_default_embedding_cache()
+        self._chunks = None
+        self._chunk_index = None
+        self._chunk_lock = threading.Lock()
+
+    def _ensure_chunk_index(self):
+        # Chunk and embed the knowledge on first use, in batched embedding requests
+        with self._chunk_lock:
+            if self._chunks is None:
+                from .vector_index import VectorIndex
+
+                chunks = chunk_document(self.knowledge, self.chunk_tokens)
+                index = VectorIndex()
+                embeddings = self.embedding_cache.get_or_compute_many(
+                    self.client.embedding_model, chunks,
+                    lambda texts: self.client.embed(texts, agent=type(self).__name__)
+                )
+                self._chunks = dict(zip(index.add(embeddings), chunks)) if chunks else {}
+                self._chunk_index = index
+
+    def _prompt_embedding(self, prompt):
+        return self.embedding_cache.get_or_compute(
+            self.client.embedding_model, prompt,
+            lambda text: self.client.embed([text], agent=type(self).__name__)[0]
         )
-    
-    def respond(self, prompt):
+
+    def _trimmed_knowledge(self, prompt_embedding):
+        # Add chunks best-first while they fit the budget, then restore document order
+        selected = []
+        used = 0
+        for chunk_id, _ in self._chunk_index.search(prompt_embedding, len(self._chunks)):
+            tokens = estimate_tokens(self._chunks[chunk_id])
+            if used + tokens <= self.max_knowledge_tokens:
+                selected.append(chunk_id)
+                used += tokens
+        return self.pinned_knowledge + "\n\n".join(self._chunks[chunk_id] for chunk_id in sorted(selected))
+
+    def select_knowledge(self, prompt):
+        # Knowledge to send with this prompt: everything, or the relevant chunks when trimming is enabled
+        if not self.max_knowledge_tokens:
+            return self.pinned_knowledge + self.knowledge
+        self._ensure_chunk_index()
+        if not self._chunks:
+            return self.pinned_knowledge
+        return self._trimmed_knowledge(self._prompt_embedding(prompt))
+
+    async def select_knowledge_async(self, prompt):
+        if not self.max_knowledge_tokens:
+            return self.pinned_knowledge + self.knowledge
+        await asyncio.to_thread(self._ensure_chunk_index)
+        if not self._chunks:
+            return self.pinned_knowledge
+        embedding = self.embedding_cache.get(self.client.embedding_model, prompt)
+        if embedding is None:
+            vectors = await self.client.embed_async([prompt], agent=type(self).__name__)
+            embedding = self.embedding_cache.put(self.client.embedding_model, prompt, vectors[0])
+        return self._trimmed_knowledge(embedding)
+
+    def build_messages(self, prompt, knowledge=None):
         # Inject persona and knowledge into system message to guide response
-        system_message = f"You are {self.persona} knowledge-based assistant. Forget all previous context. Use only the following knowledge to answer, do not use your own knowledge: {self.knowledge}. Answer the prompt based on this knowledge, not your own."
-        response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response.choices[0].message.content
+        knowledge = self.select_knowledge(prompt) if knowledge is None else knowledge
+        system_message = f"You are {self.persona} knowledge-based assistant. Forget all previous context. Use only the following knowledge to answer, do not use your own knowledge: {knowledge}. Answer the prompt based on this knowledge, not your own."
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ]
+
+    def respond(self, prompt):
+        return self.client.chat(self.build_messages(prompt), agent=type(self).__name__)
+
+    async def respond_async(self, prompt):
+        messages = self.build_messages(prompt, await self.select_knowledge_async(prompt))
+        return await self.client.chat_async(messages, agent=type(self).__name__)
+
+    def respond_stream(self, prompt):
+        # Yield the response text as it is generated
+        yield from self.client.chat_stream(self.build_messages(prompt), agent=type(self).__name__)
+
+    async def respond_stream_async(self, prompt):
+        messages = self.build_messages(prompt, await self.select_knowledge_async(prompt))
+        async for token in self.client.chat_stream_async(messages, agent=type(self).__name__):
+            yield token
 
 
 class RAGKnowledgePromptAgent:
     """
     Retrieval-Augmented Generation agent that retrieves relevant knowledge from documents
     using semantic similarity before generating responses.
+    Documents are embedded once into a vector index; pass an IVFVectorIndex for large corpora.
     """
-    def __init__(self, openai_api_key, persona, knowledge_documents):
+    def __init__(self, openai_api_key, persona, knowledge_documents, embedding_cache=None, index=None,
+                 embedding_batch_size=EMBEDDING_BATCH_SIZE, client=None):
         self.openai_api_key = openai_api_key
         self.persona = persona
-        self.knowledge_documents = knowledge_documents
-        self.client = OpenAI(
-            base_url="https://openai.vocareum.com/v1",
-            api_key=self.openai_api_key
-        )
-    
+        self.embedding_cache = embedding_cache or get_default_embedding_cache()
+        self.embedding_batch_size = embedding_batch_size
+        self.client = client or get_shared_client(self.openai_api_key)
+        self._documents = {}
+        self._keys = {}
+        if index is None:
+            from .vector_index import VectorIndex
+
+            index = VectorIndex()
+        self._index = index
+        self.add_documents(knowledge_documents)
+
+    @property
+    def knowledge_documents(self):
+        # Indexed documents in insertion order
+        return list(self._documents.values())
+
+    @knowledge_documents.setter
+    def knowledge_documents(self, documents):
+        # Replace all indexed documents
+        self._documents = {}
+        self._keys = {}
+        self._index.clear()
+        self.add_documents(documents)
+
+    def add_documents(self, documents, keys=None):
+        # Embed and index new documents without touching existing entries
+        # keys optionally name each document (for example an ingested chunk id) for later removal with remove_keys
+        documents = list(documents)
+        if not documents:
+            return []
+        ids = self._index.add(self.get_embeddings(documents))
+        self._documents.update(zip(ids, documents))
+        if keys is not None:
+            self._keys.update(zip(keys, ids))
+        return ids
+
+    def remove_documents(self, documents):
+        # Remove every indexed copy of the given documents; returns the number removed
+        documents = set(documents)
+        ids = [doc_id for doc_id, doc in self._documents.items() if doc in documents]
+        for doc_id in ids:
+            del self._documents[doc_id]
+        return self._index.remove(ids)
+
+    def remove_keys(self, keys):
+        # Remove the documents added under the given keys, leaving other copies of the same text indexed
+        ids = [self._keys.pop(key) for key in keys if key in self._keys]
+        ids = [doc_id for doc_id in ids if self._documents.pop(doc_id, None) is not None]
+        return self._index.remove(ids)
+
     def get_embedding(self, text):
-        # Generate vector embedding for semantic comparison
-        response = self.client.embeddings.create(
-            model="text-embedding-3-large",
-            input=text
-        )
-        return response.data[0].embedding
-    
+        # Generate vector embedding for semantic comparison, reusing cached vectors when available
+        return self.embedding_cache.get_or_compute(self.client.embedding_model, text, self._create_embedding)
+
+    async def get_embedding_async(self, text):
+        embedding = self.embedding_cache.get(self.client.embedding_model, text)
+        if embedding is None:
+            vectors = await self.client.embed_async([text], agent=type(self).__name__)
+            embedding = self.embedding_cache.put(self.client.embedding_model, text, vectors[0])
+        return embedding
+
+    def get_embeddings(self, texts):
+        # Embed many texts at once; only cache misses are sent, in batches of embedding_batch_size
+        return self.embedding_cache.get_or_compute_many(self.client.embedding_model, list(texts), self._create_embeddings)
+
+    def _create_embedding(self, text):
+        return self.client.embed([text], agent=type(self).__name__)[0]
+
+    def _create_embeddings(self, texts):
+        return self.client.embed(texts, batch_size=self.embedding_batch_size, agent=type(self).__name__)
+
     def retrieve_relevant_knowledge(self, prompt, top_k=2):
-        # Compute cosine similarity between prompt and each document
-        prompt_embedding = self.get_embedding(prompt)
-        similarities = []
-        for doc in self.knowledge_documents:
-            doc_embedding = self.get_embedding(doc)
-            # Cosine similarity = dot product / (norm1 * norm2)
-            similarity = np.dot(prompt_embedding, doc_embedding) / (
-                np.linalg.norm(prompt_embedding) * np.linalg.norm(doc_embedding)
-            )
-            similarities.append((doc, similarity))
-        # Sort by similarity descending and return top k documents
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        return [doc for doc, _ in similarities[:top_k]]
-    
+        # Rank indexed documents by cosine similarity and return the top k
+        return self._search(self.get_embedding(prompt), top_k)
+
+    async def retrieve_relevant_knowledge_async(self, prompt, top_k=2):
+        return self._search(await self.get_embedding_async(prompt), top_k)
+
+    def _search(self, prompt_embedding, top_k):
+        results = self._index.search(prompt_embedding, top_k)
+        return [self._documents[doc_id] for doc_id, _ in results]
+
+    def build_messages(self, prompt, relevant_knowledge):
+        # Construct context-aware messages from the retrieved documents
+        knowledge_context = "\n".join(relevant_knowledge)
+        system_message = f"You are {self.persona} knowledge-based assistant. Forget all previous context. Use only the following knowledge to answer, do not use your own knowledge: {knowledge_context}. Answer the prompt based on this knowledge, not your own."
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ]
+
     def respond(self, prompt):
         # Retrieve relevant documents and construct context-aware response
         relevant_knowledge = self.retrieve_relevant_knowledge(prompt)
-        knowledge_context = "\n".join(relevant_knowledge)
-        system_message = f"You are {self.persona} knowledge-based assistant. Forget all previous context. Use only the following knowledge to answer, do not use your own knowledge: {knowledge_context}. Answer the prompt based on this knowledge, not your own."
-        response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response.choices[0].message.content
+        return self.client.chat(self.build_messages(prompt, relevant_knowledge), agent=type(self).__name__)
+
+    async def respond_async(self, prompt):
+        relevant_knowledge = await self.retrieve_relevant_knowledge_async(prompt)
+        return await self.client.chat_async(self.build_messages(prompt, relevant_knowledge), agent=type(self).__name__)
+
+    def respond_stream(self, prompt):
+        # Retrieval happens up front; only the completion is streamed
+        relevant_knowledge = self.retrieve_relevant_knowledge(prompt)
+        yield from self.client.chat_stream(self.build_messages(prompt, relevant_knowledge), agent=type(self).__name__)
+
+    async def respond_stream_async(self, prompt):
+        relevant_knowledge = await self.retrieve_relevant_knowledge_async(prompt)
+        async for token in self.client.chat_stream_async(self.build_messages(prompt, relevant_knowledge), agent=type(self).__name__):
+            yield token
+
+
+# Verdict values the evaluator is asked to return
+VERDICT_PASS = "pass"
+VERDICT_FAIL = "fail"
 
 
 class EvaluationAgent:
     """
     Agent that iteratively evaluates and corrects another agent's responses.
     Uses a feedback loop to improve quality until criteria are met or max iterations reached.
+    Each response is first given to pre_check, a cheap local check that returns None to defer to the
+    LLM judge or (passed, feedback) to decide without any LLM call. The LLM judge answers with a JSON
+    verdict, score and correction instructions in a single call.
+    The loop also stops early once the client's BudgetManager (if any) reaches its soft cap.
     """
-    def __init__(self, openai_api_key, persona, evaluation_criteria, agent_to_evaluate, max_interactions=5):
+    def __init__(self, openai_api_key, persona, evaluation_criteria, agent_to_evaluate, max_interactions=5, client=None,
+                 pre_check=None):
         self.openai_api_key = openai_api_key
         self.persona = persona
         self.evaluation_criteria = evaluation_criteria
         self.agent_to_evaluate = agent_to_evaluate
         self.max_interactions = max_interactions
-        self.client = OpenAI(
-            base_url="https://openai.vocareum.com/v1",
-            api_key=self.openai_api_key
+        self.client = client or get_shared_client(self.openai_api_key)
+        self.pre_check = pre_check
+
+    def build_evaluation_messages(self, worker_response):
+        # Evaluate the response against criteria and ask for correction instructions in the same reply
+        evaluation_prompt = (
+            f"Evaluate the following response based on these criteria: {self.evaluation_criteria}\n\n"
+            f"Response: {worker_response}\n\n"
+            "Does this response meet the criteria? Reply with only a JSON object with these keys:\n"
+            f'"verdict": "{VERDICT_PASS}" if the response meets every criterion, otherwise "{VERDICT_FAIL}";\n'
+            '"score": a number from 0 to 10 for how well the response meets the criteria;\n'
+            '"reason": a short explanation;\n'
+            f'"correction": if the verdict is "{VERDICT_FAIL}", specific instructions on how to correct the response, otherwise "".'
         )
-    
-    def evaluate(self, prompt):
+        return [
+            {"role": "system", "content": self.persona},
+            {"role": "user", "content": evaluation_prompt}
+        ]
+
+    def build_correction_messages(self, worker_response, evaluation_result):
+        # Generate correction instructions when the judge's verdict did not include them
+        correction_prompt = f"The following response did not meet the criteria: {self.evaluation_criteria}\n\nResponse: {worker_response}\n\nEvaluation: {evaluation_result}\n\nProvide specific instructions on how to correct this response."
+        return [
+            {"role": "system", "content": self.persona},
+            {"role": "user", "content": correction_prompt}
+        ]
+
+    @staticmethod
+    def is_passing(evaluation_result):
+        # Check if response passes evaluation
+        return "yes" in evaluation_result.lower() and "no" not in evaluation_result.lower()[:evaluation_result.lower().index("yes") if "yes" in evaluation_result.lower() else 0]
+
+    @staticmethod
+    def parse_verdict(evaluation_result):
+        """
+        Turn the judge's reply into {"passed", "score", "evaluation", "correction", "source"}.
+        A JSON verdict is preferred; replies that ignore the format fall back to their leading Yes/No answer.
+        """
+        verdict = {"passed": False, "score": None, "evaluation": evaluation_result, "correction": "", "source": "llm"}
+        match = re.search(r"\{.*\}", evaluation_result, re.DOTALL)
+        if match:
+            try:
+                data = json.loads(match.group(0))
+            except ValueError:
+                data = None
+            if isinstance(data, dict) and str(data.get("verdict", "")).lower() in (VERDICT_PASS, VERDICT_FAIL):
+                try:
+                    verdict["score"] = float(data["score"])
+                except (KeyError, TypeError, ValueError):
+                    pass
+                verdict["passed"] = str(data["verdict"]).lower() == VERDICT_PASS
+                verdict["evaluation"] = str(data.get("reason") or evaluation_result)
+                verdict["correction"] = str(data.get("correction") or "")
+                return verdict
+        answer = re.match(r"\W*(yes|no|pass|fail)\b", evaluation_result, re.IGNORECASE)
+        if answer:
+            verdict["passed"] = answer.group(1).lower() in ("yes", VERDICT_PASS)
+        else:
+            verdict["passed"] = EvaluationAgent.is_passing(evaluation_result)
+        return verdict
+
+    def local_verdict(self, worker_response):
+        # Verdict from pre_check, or None when the LLM judge is needed
+        if self.pre_check is None:
+            return None
+        outcome = self.pre_check(worker_response)
+        if outcome is None:
+            return None
+        passed, feedback = outcome
+        return {
+            "passed": passed,
+            "score": 10.0 if passed else 0.0,
+            "evaluation": feedback,
+            "correction": "" if passed else feedback,
+            "source": "local"
+        }
+
+    def judge(self, worker_response):
+        # Local pre-check first; the LLM judge is only called when it cannot decide
+        verdict = self.local_verdict(worker_response)
+        if verdict is None:
+            verdict = self.parse_verdict(self.client.chat(
+                self.build_evaluation_messages(worker_response),
+                agent=type(self).__name__,
+                temperature=0
+            ))
+        return verdict
+
+    async def judge_async(self, worker_response):
+        verdict = self.local_verdict(worker_response)
+        if verdict is None:
+            verdict = self.parse_verdict(await self.client.chat_async(
+                self.build_evaluation_messages(worker_response),
+                agent=type(self).__name__,
+                temperature=0
+            ))
+        return verdict
+
+    def budget_exhausted(self):
+        # True once the run budget is near its cap, so no further correction rounds are started
+        budget = getattr(self.client, "budget", None)
+        return budget is not None and budget.soft_limit_reached
+
+    @staticmethod
+    def build_retry_prompt(prompt, worker_response, correction_instructions):
+        # Update prompt with correction feedback for next iteration
+        return f"{prompt}\n\nPrevious response: {worker_response}\n\nCorrection needed: {correction_instructions}\n\nPlease provide an improved response."
+
+    @staticmethod
+    def build_result(worker_response, verdict, iteration_count):
+        return {
+            "final_response": worker_response,
+            "evaluation": verdict["evaluation"],
+            "iterations": iteration_count,
+            "passed": verdict["passed"],
+            "score": verdict["score"]
+        }
+
+    def evaluate(self, prompt, initial_response=None):
         # Iterative evaluation and correction loop
+        # Pass initial_response when the worker has already answered the prompt to skip that call
         iteration_count = 0
         current_prompt = prompt
-        
+
         for i in range(self.max_interactions):
             iteration_count += 1
             # Get response from worker agent
-            worker_response = self.agent_to_evaluate.respond(current_prompt)
-            
-            # Evaluate the response against criteria
-            evaluation_prompt = f"Evaluate the following response based on these criteria: {self.evaluation_criteria}\n\nResponse: {worker_response}\n\nDoes this response meet the criteria? Answer with 'Yes' or 'No' and explain why."
-            evaluation_response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": self.persona},
-                    {"role": "user", "content": evaluation_prompt}
-                ],
+            if i == 0 and initial_response is not None:
+                worker_response = initial_response
+            else:
+                worker_response = self.agent_to_evaluate.respond(current_prompt)
+
+            verdict = self.judge(worker_response)
+            if verdict["passed"] or self.budget_exhausted() or iteration_count == self.max_interactions:
+                break
+
+            # A separate correction call is only needed when the judge did not include instructions
+            correction_instructions = verdict["correction"] or self.client.chat(
+                self.build_correction_messages(worker_response, verdict["evaluation"]),
+                agent=type(self).__name__,
                 temperature=0
             )
-            evaluation_result = evaluation_response.choices[0].message.content
-            
-            # Check if response passes evaluation
-            if "yes" in evaluation_result.lower() and "no" not in evaluation_result.lower()[:evaluation_result.lower().index("yes") if "yes" in evaluation_result.lower() else 0]:
-                return {
-                    "final_response": worker_response,
-                    "evaluation": evaluation_result,
-                    "iterations": iteration_count
-                }
-            
-            # Generate correction instructions for next iteration
-            correction_prompt = f"The following response did not meet the criteria: {self.evaluation_criteria}\n\nResponse: {worker_response}\n\nEvaluation: {evaluation_result}\n\nProvide specific instructions on how to correct this response."
-            correction_response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": self.persona},
-                    {"role": "user", "content": correction_prompt}
-                ],
+            current_prompt = self.build_retry_prompt(prompt, worker_response, correction_instructions)
+
+        # Return last response if max iterations reached
+        return self.build_result(worker_response, verdict, iteration_count)
+
+    async def evaluate_async(self, prompt, initial_response=None):
+        # Same loop as evaluate; sync-only worker agents are run in a thread
+        iteration_count = 0
+        current_prompt = prompt
+
+        for i in range(self.max_interactions):
+            iteration_count += 1
+            if i == 0 and initial_response is not None:
+                worker_response = initial_response
+            elif hasattr(self.agent_to_evaluate, "respond_async"):
+                worker_response = await self.agent_to_evaluate.respond_async(current_prompt)
+            else:
+                worker_response = await asyncio.to_thread(self.agent_to_evaluate.respond, current_prompt)
+
+            verdict = await self.judge_async(worker_response)
+            if verdict["passed"] or self.budget_exhausted() or iteration_count == self.max_interactions:
+                break
+
+            correction_instructions = verdict["correction"] or await self.client.chat_async(
+                self.build_correction_messages(worker_response, verdict["evaluation"]),
+                agent=type(self).__name__,
                 temperature=0
             )
-            correction_instructions = correction_response.choices[0].message.content
-            
-            # Update prompt with correction feedback for next iteration
-            current_prompt = f"{prompt}\n\nPrevious response: {worker_response}\n\nCorrection needed: {correction_instructions}\n\nPlease provide an improved response."
-        
-        # Return last response if max iterations reached
-        return {
-            "final_response": worker_response,
-            "evaluation": evaluation_result,
-            "iterations": iteration_count
-        }
+            current_prompt = self.build_retry_prompt(prompt, worker_response, correction_instructions)
+
+        return self.build_result(worker_response, verdict, iteration_count)
+
+
+# Routing tiers, in the order they are tried
+ROUTE_CACHED = "cache"
+ROUTE_LEXICAL = "lexical"
+ROUTE_NEAR_DUPLICATE = "near_duplicate"
+ROUTE_EMBEDDING = "embedding"
+ROUTE_LLM = "llm"
+ROUTING_TIERS = (ROUTE_CACHED, ROUTE_LEXICAL, ROUTE_NEAR_DUPLICATE, ROUTE_EMBEDDING, ROUTE_LLM)
+# Sentences about what an agent does not do ("Does not create user stories") are left out of its lexical
+# document, since matching their words would route exactly those prompts to it
+NEGATED_SENTENCE_PATTERN = re.compile(r"[^.!?\n]*\b(?:does not|doesn't|do not|don't|never)\b[^.!?\n]*[.!?]?", re.IGNORECASE)
 
 
 class RoutingAgent:
     """
-    Agent that routes prompts to the most appropriate specialized agent
-    based on semantic similarity between the prompt and agent descriptions.
+    Agent that routes prompts to the most appropriate specialized agent.
+    Each prompt goes through the ROUTING_TIERS cascade (cached decision, keywords, near-duplicate,
+    embeddings, LLM tie-break) until one tier can decide; decisions are kept in routing_cache.
     """
-    def __init__(self, openai_api_key):
+    def __init__(self, openai_api_key, embedding_cache=None, embedding_batch_size=EMBEDDING_BATCH_SIZE, client=None,
+                 lexical_margin=0.45, embedding_margin=0.02, llm_tiebreak=True, routing_cache=None,
+                 min_lexical_terms=2):
         self.openai_api_key = openai_api_key
-        self.agents = []
-        self.client = OpenAI(
-            base_url="https://openai.vocareum.com/v1",
-            api_key=self.openai_api_key
-        )
-    
+        self.embedding_cache = embedding_cache or get_default_embedding_cache()
+        self.embedding_batch_size = embedding_batch_size
+        self.client = client or get_shared_client(self.openai_api_key)
+        self.lexical_margin = lexical_margin
+        self.min_lexical_terms = min_lexical_terms
+        self.embedding_margin = embedding_margin
+        self.llm_tiebreak = llm_tiebreak
+        self.routing_cache = routing_cache if routing_cache is not None else RoutingCache()
+        from .lexical_index import BM25Index
+        from .vector_index import VectorIndex
+
+        self._agents = []
+        self._agents_by_name = {}
+        self._fingerprint = RoutingCache.make_fingerprint([])
+        self._lexical_index = BM25Index()
+        self._index = VectorIndex()
+        self._embedded = 0
+        self._lock = threading.Lock()
+        self.tier_hits = dict.fromkeys(ROUTING_TIERS, 0)
+        self.llm_fallbacks = 0
+
+    @property
+    def agents(self):
+        # Registered agents in registration order; use register_agent to add more
+        return tuple(self._agents)
+
+    @agents.setter
+    def agents(self, agents):
+        # Replace all registered agents
+        with self._lock:
+            self._agents = []
+            self._agents_by_name = {}
+            self._fingerprint = RoutingCache.make_fingerprint([])
+            self._lexical_index.clear()
+            self._index.clear()
+            self._embedded = 0
+        self.register_agents(agents)
+
+    def register_agent(self, name, description, func):
+        return self.register_agents([{"name": name, "description": description, "func": func}])[0]
+
+    def register_agents(self, agents):
+        # Index the descriptions for the lexical tier; embedding them waits until a prompt needs it
+        agents = [{"name": a["name"], "description": a["description"], "func": a["func"]} for a in agents]
+        if not agents:
+            return []
+        with self._lock:
+            self._lexical_index.add([NEGATED_SENTENCE_PATTERN.sub(" ", agent["description"]) for agent in agents])
+            self._agents.extend(agents)
+            self._agents_by_name.update((agent["name"], agent) for agent in agents)
+            self._fingerprint = RoutingCache.make_fingerprint(self._agents)
+        return agents
+
+    def _ensure_embedded(self):
+        # Embed every description registered since the last call, in batched requests;
+        # rows of the vector index stay aligned with the registration order
+        with self._lock:
+            pending = self._agents[self._embedded:]
+            if pending:
+                self._index.add(self.get_embeddings([agent["description"] for agent in pending]))
+                self._embedded += len(pending)
+
     def get_embedding(self, text):
-        # Generate vector embedding for semantic routing
-        response = self.client.embeddings.create(
-            model="text-embedding-3-large",
-            input=text
+        # Generate vector embedding for semantic routing, reusing cached vectors when available
+        return self.embedding_cache.get_or_compute(self.client.embedding_model, text, self._create_embedding)
+
+    async def get_embedding_async(self, text):
+        embedding = self.embedding_cache.get(self.client.embedding_model, text)
+        if embedding is None:
+            vectors = await self.client.embed_async([text], agent=type(self).__name__)
+            embedding = self.embedding_cache.put(self.client.embedding_model, text, vectors[0])
+        return embedding
+
+    def get_embeddings(self, texts):
+        # Embed many texts at once; only cache misses are sent, in batches of embedding_batch_size
+        return self.embedding_cache.get_or_compute_many(self.client.embedding_model, list(texts), self._create_embeddings)
+
+    def _create_embedding(self, text):
+        return self.client.embed([text], agent=type(self).__name__)[0]
+
+    def _create_embeddings(self, texts):
+        return self.client.embed(texts, batch_size=self.embedding_batch_size, agent=type(self).__name__)
+
+    def _cached_choice(self, prompt):
+        # (agent, score) of an earlier decision for this exact prompt with the same agents, otherwise None
+        record = self.routing_cache.get(self._fingerprint, prompt)
+        agent = self._agents_by_name.get(record["agent"]) if record else None
+        return (agent, record["score"]) if agent else None
+
+    def _near_duplicate_choice(self, prompt_embedding):
+        # (agent, similarity to the earlier prompt) when a prompt at least routing_cache.similarity_threshold
+        # similar was routed before, otherwise None
+        record = self.routing_cache.nearest(
+            self._fingerprint, prompt_embedding,
+            lambda prompt: self.embedding_cache.get(self.client.embedding_model, prompt)
         )
-        return response.data[0].embedding
-    
-    def route(self, prompt):
-        # Find the best agent using cosine similarity
+        agent = self._agents_by_name.get(record["agent"]) if record else None
+        return (agent, record["similarity"]) if agent else None
+
+    def _lexical_choice(self, prompt):
+        # (agent, BM25 score) when the best description beats the runner-up by lexical_margin (relative to the
+        # best score) and shares min_lexical_terms terms with the prompt, otherwise None; None margin skips the tier
+        # A single shared word ("plan", "product") is too little evidence, however large its score
+        if self.lexical_margin is None:
+            return None
+        scores = self._lexical_index.scores(prompt)
+        order = scores.argsort()[::-1]
+        best = float(scores[order[0]])
+        runner_up = float(scores[order[1]]) if len(order) > 1 else 0.0
+        if best <= 0 or (best - runner_up) / best < self.lexical_margin:
+            return None
+        if self._lexical_index.matched_terms(prompt)[order[0]] < self.min_lexical_terms:
+            return None
+        return self._agents[order[0]], best
+
+    def _embedding_choice(self, similarities):
+        # (agent, similarity, ties) from the prompt's similarity to each description: ties lists the agents within
+        # embedding_margin of the best, best first, for the LLM tier; it is empty when the best agent is clear or
+        # llm_tiebreak is off
+        order = similarities.argsort()[::-1]
+        best = float(similarities[order[0]])
+        ties = [
+            (self._agents[row], float(similarities[row]))
+            for row in order if best - similarities[row] < self.embedding_margin
+        ] if self.llm_tiebreak else []
+        return self._agents[order[0]], best, ties if len(ties) > 1 else []
+
+    def build_tiebreak_messages(self, prompt, candidates):
+        # Ask the LLM to choose between agents the embeddings could not separate
+        options = "\n".join(f"- {agent['name']}: {agent['description']}" for agent in candidates)
+        return [
+            {"role": "system", "content": (
+                "You are a Routing Agent. Choose the one agent best suited to handle the task. "
+                "Reply with the agent's name only."
+            )},
+            {"role": "user", "content": f"Agents:\n{options}\n\nTask: {prompt}"}
+        ]
+
+    @staticmethod
+    def parse_choice(response, candidates):
+        # Candidate named earliest in the response (the longer name wins at the same position), or None
+        text = response.lower()
+        mentions = [
+            (text.find(agent["name"].lower()), -len(agent["name"]), index)
+            for index, agent in enumerate(candidates) if agent["name"].lower() in text
+        ]
+        return candidates[min(mentions)[2]] if mentions else None
+
+    def _tiebreak(self, response, ties):
+        # The LLM's choice with its similarity; an unusable answer falls back to the embedding tier's best
+        choice = self.parse_choice(response, [agent for agent, _ in ties])
+        for agent, similarity in ties:
+            if agent is choice:
+                return agent, similarity
+        with self._lock:
+            self.llm_fallbacks += 1
+        return ties[0]
+
+    def _record(self, tier, agent, score):
+        with self._lock:
+            self.tier_hits[tier] += 1
+        return agent, score
+
+    def _decide(self, tier, prompt, agent, score, prompt_embedding=None):
+        # Count a fresh decision and remember it, with the prompt embedding if one was computed
+        self.routing_cache.put(self._fingerprint, prompt, agent["name"], score, tier, prompt_embedding)
+        return self._record(tier, agent, score)
+
+    def select_agent(self, prompt):
+        """
+        Return (agent, score) from the cheapest tier that can decide, or (None, None) without agents.
+        score is the BM25 score for lexical decisions and a cosine similarity otherwise (for near-duplicates, the
+        similarity to the earlier prompt); cached decisions return the score stored with them.
+        """
+        if not self._agents:
+            return None, None
+        cached = self._cached_choice(prompt)
+        if cached is not None:
+            return self._record(ROUTE_CACHED, *cached)
+        lexical = self._lexical_choice(prompt)
+        if lexical is not None:
+            return self._decide(ROUTE_LEXICAL, prompt, *lexical)
         prompt_embedding = self.get_embedding(prompt)
-        best_similarity = -1
-        best_agent = None
-        
-        for agent in self.agents:
-            agent_description_embedding = self.get_embedding(agent["description"])
-            # Compute cosine similarity between prompt and agent description
-            similarity = np.dot(prompt_embedding, agent_description_embedding) / (
-                np.linalg.norm(prompt_embedding) * np.linalg.norm(agent_description_embedding)
-            )
-            
-            # Track the agent with highest similarity score
-            if similarity > best_similarity:
-                best_similarity = similarity
-                best_agent = agent
-        
+        near_duplicate = self._near_duplicate_choice(prompt_embedding)
+        if near_duplicate is not None:
+            return self._decide(ROUTE_NEAR_DUPLICATE, prompt, *near_duplicate, prompt_embedding)
+        self._ensure_embedded()
+        return self._similarity_decision(prompt, prompt_embedding, self._index.scores(prompt_embedding))
+
+    def _similarity_decision(self, prompt, prompt_embedding, similarities):
+        # Embedding tier, escalating ties to the LLM tier
+        agent, similarity, ties = self._embedding_choice(similarities)
+        if not ties:
+            return self._decide(ROUTE_EMBEDDING, prompt, agent, similarity, prompt_embedding)
+        response = self.client.chat(
+            self.build_tiebreak_messages(prompt, [a for a, _ in ties]), agent=type(self).__name__, temperature=0
+        )
+        return self._decide(ROUTE_LLM, prompt, *self._tiebreak(response, ties), prompt_embedding)
+
+    async def select_agent_async(self, prompt):
+        if not self._agents:
+            return None, None
+        cached = self._cached_choice(prompt)
+        if cached is not None:
+            return self._record(ROUTE_CACHED, *cached)
+        lexical = self._lexical_choice(prompt)
+        if lexical is not None:
+            return self._decide(ROUTE_LEXICAL, prompt, *lexical)
+        prompt_embedding = await self.get_embedding_async(prompt)
+        near_duplicate = self._near_duplicate_choice(prompt_embedding)
+        if near_duplicate is not None:
+            return self._decide(ROUTE_NEAR_DUPLICATE, prompt, *near_duplicate, prompt_embedding)
+        if self._embedded < len(self._agents):
+            await asyncio.to_thread(self._ensure_embedded)
+        agent, similarity, ties = self._embedding_choice(self._index.scores(prompt_embedding))
+        if not ties:
+            return self._decide(ROUTE_EMBEDDING, prompt, agent, similarity, prompt_embedding)
+        response = await self.client.chat_async(
+            self.build_tiebreak_messages(prompt, [a for a, _ in ties]), agent=type(self).__name__, temperature=0
+        )
+        return self._decide(ROUTE_LLM, prompt, *self._tiebreak(response, ties), prompt_embedding)
+
+    def select_agents(self, prompts):
+        """
+        select_agent for many prompts at once, returning one (agent, score) pair per prompt.
+        Prompts not settled by the cache or the lexical tier are embedded together in batched requests,
+        and those that are not near-duplicates are scored against every description with one matrix product.
+        """
+        prompts = list(prompts)
+        if not self._agents:
+            return [(None, None)] * len(prompts)
+        choices = [None] * len(prompts)
+        pending = []
+        for position, prompt in enumerate(prompts):
+            cached = self._cached_choice(prompt)
+            if cached is not None:
+                choices[position] = self._record(ROUTE_CACHED, *cached)
+                continue
+            lexical = self._lexical_choice(prompt)
+            if lexical is not None:
+                choices[position] = self._decide(ROUTE_LEXICAL, prompt, *lexical)
+            else:
+                pending.append(position)
+        if not pending:
+            return choices
+
+        unresolved = []
+        for position, prompt_embedding in zip(pending, self.get_embeddings([prompts[p] for p in pending])):
+            near_duplicate = self._near_duplicate_choice(prompt_embedding)
+            if near_duplicate is not None:
+                choices[position] = self._decide(ROUTE_NEAR_DUPLICATE, prompts[position], *near_duplicate, prompt_embedding)
+            else:
+                unresolved.append((position, prompt_embedding))
+        if unresolved:
+            self._ensure_embedded()
+            similarities = self._index.scores_many([prompt_embedding for _, prompt_embedding in unresolved])
+            for (position, prompt_embedding), row in zip(unresolved, similarities):
+                choices[position] = self._similarity_decision(prompts[position], prompt_embedding, row)
+        return choices
+
+    async def select_agents_async(self, prompts):
+        return await asyncio.to_thread(self.select_agents, prompts)
+
+    def rank(self, prompt, k=None):
+        """
+        The k best agents (all of them by default) as (agent, similarity) pairs, best first, from one
+        matrix-vector product of the prompt embedding with every description. Ranking bypasses the cascade
+        and the routing cache; the gap between the first two similarities is the margin the embedding tier
+        compares with embedding_margin.
+        """
+        if not self._agents:
+            return []
+        self._ensure_embedded()
+        return self._ranked(self._index.scores(self.get_embedding(prompt)), k)
+
+    async def rank_async(self, prompt, k=None):
+        if not self._agents:
+            return []
+        if self._embedded < len(self._agents):
+            await asyncio.to_thread(self._ensure_embedded)
+        return self._ranked(self._index.scores(await self.get_embedding_async(prompt)), k)
+
+    def _ranked(self, similarities, k):
+        from .vector_index import top_k_indices
+
+        rows = top_k_indices(similarities, len(self._agents) if k is None else k)
+        return [(self._agents[row], float(similarities[row])) for row in rows]
+
+    def stats(self):
+        # How many routes each tier decided, how often the LLM tier's answer could not be used, and the cache's counters
+        with self._lock:
+            routes = sum(self.tier_hits.values())
+            return {
+                "routes": routes,
+                "tiers": {
+                    tier: {"hits": hits, "share": hits / routes if routes else 0.0}
+                    for tier, hits in self.tier_hits.items()
+                },
+                "llm_fallbacks": self.llm_fallbacks,
+                "cache": self.routing_cache.stats()
+            }
+
+    def route(self, prompt):
         # Execute the best matching agent's function
+        best_agent, _ = self.select_agent(prompt)
         if best_agent:
             return best_agent["func"](prompt)
         return None
 
+    @staticmethod
+    async def _call_agent_async(func, prompt):
+        # Coroutine functions are awaited; plain callables run in a worker thread so they never block the loop
+        if inspect.iscoroutinefunction(func):
+            return await func(prompt)
+        result = await asyncio.to_thread(func, prompt)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def route_async(self, prompt):
+        # Agent functions may be coroutine functions or plain callables
+        best_agent, _ = await self.select_agent_async(prompt)
+        if best_agent:
+            return await self._call_agent_async(best_agent["func"], prompt)
+        return None
+
+    def route_many(self, prompts):
+        # Route all prompts with select_agents, then run each chosen agent's function in order (None without a match)
+        prompts = list(prompts)
+        return [
+            best_agent["func"](prompt) if best_agent else None
+            for prompt, (best_agent, _) in zip(prompts, self.select_agents(prompts))
+        ]
+
+    async def route_many_async(self, prompts):
+        # Agent functions run concurrently; coroutine functions and plain callables are both accepted
+        prompts = list(prompts)
+
+        async def run(prompt, best_agent):
+            if not best_agent:
+                return None
+            return await self._call_agent_async(best_agent["func"], prompt)
+
+        choices = await self.select_agents_async(prompts)
+        return await asyncio.gather(*(run(prompt, best_agent) for prompt, (best_agent, _) in zip(prompts, choices)))
+
 
 class ActionPlanningAgent:
     """
     Agent that breaks down high-level requests into discrete, actionable steps.
     Parses and cleans the LLM's response to extract a structured list of steps.
     """
-    def __init__(self, openai_api_key, knowledge):
+    def __init__(self, openai_api_key, knowledge, client=None):
         self.openai_api_key = openai_api_key
         self.knowledge = knowledge
-        self.client = OpenAI(
-            base_url="https://openai.vocareum.com/v1",
-            api_key=self.openai_api_key
-        )
-    
-    def extract_steps_from_prompt(self, prompt):
+        self.client = client or get_shared_client(self.openai_api_key)
+
+    def build_messages(self, prompt):
         # Request LLM to break down prompt into actionable steps
         system_message = f"You are an Action Planning Agent. {self.knowledge}"
-        response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        response_text = response.choices[0].message.content
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ]
+
+    @staticmethod
+    def parse_steps(response_text):
         # Parse response into clean steps, filtering out empty lines and headers
-        steps = [line.strip() for line in response_text.split("\n") if line.strip() and not line.strip().startswith("#")]
-        return steps
+        return [line.strip() for line in response_text.split("\n") if line.strip() and not line.strip().startswith("#")]
+
+    def extract_steps_from_prompt(self, prompt):
+        return self.parse_steps(self.client.chat(self.build_messages(prompt), agent=type(self).__name__))
+
+    async def extract_steps_from_prompt_async(self, prompt):
+        return self.parse_steps(await self.client.chat_async(self.build_messages(prompt), agent=type(self).__name__))
+
+    def plan_stream(self, prompt):
+        # Yield the raw plan text as it is generated; pass the joined text to parse_steps
+        yield from self.client.chat_stream(self.build_messages(prompt), agent=type(self).__name__)
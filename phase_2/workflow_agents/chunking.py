@@ -0,0 +1,175 @@
+# Splitting long knowledge texts into retrievable chunks
+# Chunk sizes are measured with the same rough token estimate used elsewhere in the package
+
+import re
+
+from .backends import estimate_tokens
+
+
+def _split_oversized(text, max_tokens):
+    # Break a block that exceeds max_tokens at line boundaries, falling back to words for single long lines
+    lines = [line for line in text.splitlines() if line.strip()]
+    by_line = len(lines) > 1
+    units, separator = (lines, "\n") if by_line else (text.split(), " ")
+    pieces = []
+    current = []
+    for unit in units:
+        if by_line and estimate_tokens(unit) > max_tokens:
+            if current:
+                pieces.append(separator.join(current))
+                current = []
+            pieces.extend(_split_oversized(unit, max_tokens))
+            continue
+        if current and estimate_tokens(separator.join(current + [unit])) > max_tokens:
+            pieces.append(separator.join(current))
+            current = []
+        current.append(unit)
+    if current:
+        pieces.append(separator.join(current))
+    return pieces
+
+
+def chunk_text(text, max_tokens=200):
+    """
+    Split text into chunks of at most max_tokens (estimated), keeping paragraphs together.
+    Consecutive paragraphs are merged while they fit; longer paragraphs are split by line, then by word.
+    """
+    chunks = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) > max_tokens:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(_split_oversized(paragraph, max_tokens))
+            continue
+        candidate = f"{current}\n\n{paragraph}" if current else paragraph
+        if estimate_tokens(candidate) > max_tokens:
+            chunks.append(current)
+            current = paragraph
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# Numbered ("3.1 Priority Detection") and Markdown ("## Priority Detection") section headings
+NUMBERED_HEADING_PATTERN = re.compile(r"^(\d+(?:\.\d+)*)\.?\s+([A-Z][^.!?:]{0,78})$")
+MARKDOWN_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+?)\s*#*$")
+
+
+def heading_level(line):
+    # Nesting level of a heading line (1 for top level), or None for ordinary text
+    line = line.strip()
+    match = MARKDOWN_HEADING_PATTERN.match(line)
+    if match:
+        return len(match.group(1))
+    match = NUMBERED_HEADING_PATTERN.match(line)
+    if match:
+        return match.group(1).count(".") + 1
+    return None
+
+
+def split_sections(lines):
+    """
+    Group an iterable of lines into sections, yielding {"heading", "text"} dicts lazily.
+    heading is the path of enclosing headings joined with " > " ("" for text before the first heading);
+    sections with no text of their own are skipped, their heading still appears in their children's paths.
+    A numbered line ("3.1 Priority Detection") is only a heading when text follows it, directly or under
+    its numbered sub-headings; otherwise it is a list item ("1. Install the package") and kept as text.
+    """
+    path = []
+    body = []
+    # Numbered lines not yet known to be headings or list items, as (number, line)
+    pending = []
+
+    def section():
+        text = "\n".join(body).strip()
+        return {"heading": " > ".join(title for _, title in path), "text": text} if text else None
+
+    def open_heading(level, title):
+        # Close the current section (returned if it has text) and start a new one under title
+        current = section()
+        body.clear()
+        while path and path[-1][0] >= level:
+            path.pop()
+        path.append((level, title))
+        return current
+
+    def resolve(text_follows):
+        # Headings are the last pending line and its numbered ancestors, and only if text follows them;
+        # consecutive numbers at the same depth ("1.", "2.") are a list, not empty sections
+        last = pending[-1][0] if text_follows and pending else None
+        if last is not None and any(number.count(".") == last.count(".") for number, _ in pending[:-1]):
+            last = None
+        closed = []
+        for number, line in pending:
+            if last is not None and (number == last or last.startswith(number + ".")):
+                closed.append(open_heading(number.count(".") + 1, line.strip()))
+            else:
+                body.append(line)
+        pending.clear()
+        return [current for current in closed if current]
+
+    for line in lines:
+        stripped = line.strip()
+        markdown = MARKDOWN_HEADING_PATTERN.match(stripped)
+        numbered = None if markdown else NUMBERED_HEADING_PATTERN.match(stripped)
+        if numbered:
+            pending.append((numbered.group(1), line))
+            continue
+        if markdown:
+            yield from resolve(False)
+            current = open_heading(len(markdown.group(1)), stripped.lstrip("#").strip())
+            if current:
+                yield current
+            continue
+        if pending:
+            if not stripped:
+                continue
+            yield from resolve(True)
+        body.append(line)
+    yield from resolve(False)
+    current = section()
+    if current:
+        yield current
+
+
+def _tail(text, max_tokens):
+    # Trailing words of text that fit in max_tokens, used as overlap for the next chunk
+    words = []
+    for word in reversed(text.split()):
+        if estimate_tokens(" ".join([word] + words)) > max_tokens:
+            break
+        words.insert(0, word)
+    return " ".join(words)
+
+
+def chunk_section(section, max_tokens=200, overlap_tokens=0):
+    """
+    Split one section into chunk texts of at most max_tokens (estimated).
+    Every chunk starts with the section's heading path so it stays meaningful on its own,
+    and repeats the last overlap_tokens of the previous chunk of the same section.
+    """
+    prefix = f"{section['heading']}\n" if section["heading"] else ""
+    body_tokens = max(1, max_tokens - estimate_tokens(prefix) - overlap_tokens)
+    chunks = []
+    previous = None
+    for piece in chunk_text(section["text"], body_tokens):
+        overlap = _tail(previous, overlap_tokens) if previous and overlap_tokens else ""
+        chunks.append(prefix + (f"...{overlap}\n{piece}" if overlap else piece))
+        previous = piece
+    return chunks
+
+
+def chunk_document(text, max_tokens=200, overlap_tokens=0):
+    # Heading-aware chunking of a whole document held in memory
+    return [
+        chunk
+        for section in split_sections(text.splitlines())
+        for chunk in chunk_section(section, max_tokens, overlap_tokens)
+    ]
@@ -0,0 +1,151 @@
+# Opt-in cache for chat completions
+# Identical requests (model, messages, temperature and other parameters) are answered from the cache
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryCacheBackend:
+    """
+    In-process LRU storage for cached completions, bounded by max_entries.
+    """
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        # Returns (value, created_at) or None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, created_at):
+        with self._lock:
+            self._entries[key] = (value, created_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """
+    SQLite storage for cached completions so they survive process restarts.
+    The least recently used rows are evicted once max_entries is exceeded.
+    """
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed_at)")
+
+    def get(self, key):
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT value, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._connection.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            return row
+
+    def set(self, key, value, created_at):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO completions (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, created_at, time.time())
+            )
+            self._connection.execute(
+                "DELETE FROM completions WHERE key IN ("
+                "SELECT key FROM completions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def delete(self, key):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM completions WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM completions")
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+
+class CompletionCache:
+    """
+    Completion cache with optional time-to-live on top of a pluggable backend.
+    With deterministic_only=True only temperature=0 requests are cached. With refresh=True every lookup
+    misses, so each request goes to the backend, and the new completions replace the stored ones.
+    """
+    def __init__(self, backend=None, ttl=None, deterministic_only=False, refresh=False):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl = ttl
+        self.deterministic_only = deterministic_only
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model, messages, params):
+        # Canonical JSON so that parameter order does not change the key
+        payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def is_cacheable(self, params):
+        return not self.deterministic_only or params.get("temperature") == 0
+
+    def get(self, model, messages, params):
+        # Return a cached completion or None when missing or expired
+        key = self.make_key(model, messages, params)
+        entry = None if self.refresh else self.backend.get(key)
+        if entry is not None and self.ttl is not None and time.time() - entry[1] > self.ttl:
+            self.backend.delete(key)
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry[0]
+
+    def put(self, model, messages, params, content):
+        self.backend.set(self.make_key(model, messages, params), content, time.time())
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.backend)
+            }
@@ -0,0 +1,136 @@
+# Per-call instrumentation for LLMClient
+# Hooks receive an event dict when each chat or embedding call starts and ends
+
+import contextlib
+import contextvars
+import json
+import threading
+from collections import defaultdict
+
+# Labels (such as the workflow step) attached to every call made inside a call_context block
+_call_labels = contextvars.ContextVar("call_labels", default={})
+
+
+@contextlib.contextmanager
+def call_context(**labels):
+    """
+    Attach labels to every LLM call made inside the block, e.g. call_context(step="Define user stories").
+    Nested blocks add to (and may override) the outer labels.
+    """
+    token = _call_labels.set({**_call_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _call_labels.reset(token)
+
+
+def current_labels():
+    return dict(_call_labels.get())
+
+
+class CallHook:
+    """
+    Base class for call hooks; override either method.
+    Events carry call_id, kind ("chat", "chat_stream" or "embedding"), model, agent, any call_context labels,
+    start_time, cache_hit and retries (updated by the RequestScheduler as attempts fail); end events add
+    latency (including queueing and retries), prompt_tokens, completion_tokens, usage_estimated and error.
+    Exceptions raised by on_call_start abort the call.
+    """
+    def on_call_start(self, event):
+        pass
+
+    def on_call_end(self, event):
+        pass
+
+
+class CallStatsAggregator(CallHook):
+    """
+    Accumulates call counts, latency, tokens, cache hits, retries and errors,
+    in total and grouped by call kind, agent, model and the "step" and "role" call_context labels.
+    Pass group_by to group by other event fields or labels as well.
+    """
+    GROUP_BY = ("kind", "agent", "model", "step", "role")
+
+    def __init__(self, group_by=None):
+        self.group_by = tuple(group_by or self.GROUP_BY)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._totals = self._empty()
+            self._groups = {field: defaultdict(self._empty) for field in self.group_by}
+
+    @staticmethod
+    def _empty():
+        return {
+            "calls": 0,
+            "latency_seconds": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cache_hits": 0,
+            "retries": 0,
+            "errors": 0
+        }
+
+    @staticmethod
+    def _add(totals, event):
+        totals["calls"] += 1
+        totals["latency_seconds"] += event["latency"]
+        totals["prompt_tokens"] += event["prompt_tokens"]
+        totals["completion_tokens"] += event["completion_tokens"]
+        totals["cache_hits"] += int(event["cache_hit"])
+        totals["retries"] += event["retries"]
+        totals["errors"] += int(event["error"] is not None)
+
+    def on_call_end(self, event):
+        with self._lock:
+            self._add(self._totals, event)
+            for field, groups in self._groups.items():
+                self._add(groups[str(event.get(field))], event)
+
+    def summary(self):
+        # Snapshot of all counters as plain dicts
+        with self._lock:
+            return {
+                "total": dict(self._totals),
+                **{f"by_{field}": {key: dict(value) for key, value in groups.items()}
+                   for field, groups in self._groups.items()}
+            }
+
+    def format_report(self, group_by="step"):
+        # Human-readable table of the totals grouped by one field
+        summary = self.summary()
+        lines = [
+            f"{group_by:<60} {'calls':>6} {'seconds':>9} {'prompt tok':>11} {'compl tok':>10} {'cached':>7} {'retries':>8}"
+        ]
+        rows = sorted(
+            summary[f"by_{group_by}"].items(),
+            key=lambda item: (-item[1]["latency_seconds"], -item[1]["prompt_tokens"] - item[1]["completion_tokens"])
+        )
+        for key, totals in rows + [("TOTAL", summary["total"])]:
+            lines.append(
+                f"{key[:60]:<60} {totals['calls']:>6} {totals['latency_seconds']:>9.2f} "
+                f"{totals['prompt_tokens']:>11} {totals['completion_tokens']:>10} {totals['cache_hits']:>7} {totals['retries']:>8}"
+            )
+        return "\n".join(lines)
+
+
+class TraceFileExporter(CallHook):
+    """
+    Appends one JSON line per finished call to a local trace file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def on_call_end(self, event):
+        line = json.dumps(event, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,182 @@
+# Cache of routing decisions, so repeated workflow steps are routed without any scoring or API calls
+# Decisions are reused for exact prompt matches and, through the prompts' cached embeddings, for near-duplicates
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class RoutingCache:
+    """
+    Prompt -> agent name decisions, grouped by a fingerprint of the registered agents (names and
+    descriptions) so a change to the agents never reuses stale decisions. Exact lookups match prompts
+    after lowercasing and collapsing whitespace. Near-duplicate lookups compare a prompt embedding with
+    the embeddings of earlier prompts and reuse the closest decision at or above similarity_threshold.
+    At most max_entries decisions are kept, the least recently decided or used evicted first, and with a ttl
+    (seconds) decisions older than that are no longer used.
+    With a path the decisions are kept in a JSON file, rewritten atomically once flush_every new decisions
+    have accumulated and on flush(); embeddings are not stored there but looked up again (in the embedding
+    cache) when first needed.
+    """
+    def __init__(self, path=None, similarity_threshold=0.95, max_entries=10000, ttl=None, flush_every=32):
+        self.path = path
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._records = {}
+        self._indexes = {}
+        self._unsaved = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                records = json.load(f).get("records", {})
+            # Oldest first, so the most recent decisions survive the size bound
+            for key, record in sorted(records.items(), key=lambda item: item[1]["decided_at"]):
+                if not self._expired(record):
+                    self._records[key] = record
+            self._evict()
+
+    @staticmethod
+    def make_fingerprint(agents):
+        return hashlib.sha256(
+            json.dumps([[agent["name"], agent["description"]] for agent in agents]).encode("utf-8")
+        ).hexdigest()
+
+    @staticmethod
+    def normalize(prompt):
+        return " ".join(prompt.lower().split())
+
+    @classmethod
+    def make_key(cls, fingerprint, prompt):
+        return hashlib.sha256(f"{fingerprint}\0{cls.normalize(prompt)}".encode("utf-8")).hexdigest()
+
+    def __len__(self):
+        return len(self._records)
+
+    def _expired(self, record):
+        return self.ttl is not None and time.time() - record["decided_at"] > self.ttl
+
+    def _evict(self):
+        # Called with the lock held; drops the least recently used decisions beyond max_entries
+        while self.max_entries is not None and len(self._records) > self.max_entries:
+            self._drop(next(iter(self._records)))
+            self.evictions += 1
+
+    def _drop(self, key):
+        # Called with the lock held; the near-duplicate index of its agent set is rebuilt when next needed
+        record = self._records.pop(key)
+        self._indexes.pop(record["fingerprint"], None)
+        self._unsaved += 1
+
+    def get(self, fingerprint, prompt):
+        # Stored {"agent", "score", "tier", ...} record for this prompt, or None
+        key = self.make_key(fingerprint, prompt)
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None and self._expired(record):
+                self._drop(key)
+                record = None
+            if record is None:
+                self.misses += 1
+                return None
+            # Dicts keep insertion order, so moving a used decision to the end makes eviction LRU
+            self._records[key] = self._records.pop(key)
+            self.hits += 1
+            return dict(record)
+
+    def nearest(self, fingerprint, embedding, lookup_embedding):
+        """
+        Record of the most similar earlier prompt, with its "similarity", if it reaches the threshold.
+        lookup_embedding(prompt) returns a cached embedding or None; it is used once per stored prompt
+        to build the near-duplicate index for this fingerprint.
+        """
+        with self._lock:
+            index, keys = self._index_for(fingerprint, lookup_embedding)
+            if not len(index):
+                return None
+            row_id, similarity = index.best(embedding)
+            if similarity < self.similarity_threshold or self._expired(self._records[keys[row_id]]):
+                return None
+            self.near_hits += 1
+            return {**self._records[keys[row_id]], "similarity": similarity}
+
+    def _index_for(self, fingerprint, lookup_embedding):
+        # Called with the lock held; vector index (and the record key of each row) for one agent set
+        if fingerprint not in self._indexes:
+            from .vector_index import VectorIndex
+
+            index, keys = VectorIndex(), []
+            for key, record in self._records.items():
+                if record["fingerprint"] != fingerprint or not record.get("embedded") or self._expired(record):
+                    continue
+                embedding = lookup_embedding(record["prompt"])
+                if embedding is not None:
+                    index.add([embedding])
+                    keys.append(key)
+            self._indexes[fingerprint] = (index, keys)
+        return self._indexes[fingerprint]
+
+    def put(self, fingerprint, prompt, agent, score=None, tier=None, embedding=None):
+        # Remember a decision; with the prompt's embedding it also serves near-duplicate lookups
+        key = self.make_key(fingerprint, prompt)
+        record = {
+            "fingerprint": fingerprint,
+            "prompt": prompt,
+            "agent": agent,
+            "score": score,
+            "tier": tier,
+            "embedded": embedding is not None,
+            "decided_at": time.time()
+        }
+        with self._lock:
+            is_new = self._records.pop(key, None) is None
+            self._records[key] = record
+            if embedding is not None and fingerprint in self._indexes and is_new:
+                index, keys = self._indexes[fingerprint]
+                index.add([embedding])
+                keys.append(key)
+            self._unsaved += 1
+            self._evict()
+            if self._unsaved >= self.flush_every:
+                self._save()
+        return record
+
+    def flush(self):
+        # Write decisions not yet saved; front ends call this when a run ends
+        with self._lock:
+            if self._unsaved:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._records = {}
+            self._indexes = {}
+            self._save()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._records),
+                "evictions": self.evictions,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def _save(self):
+        self._unsaved = 0
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"records": self._records}, f, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,199 @@
+# In-memory vector indexes used for semantic matching by the embedding-based agents
+# Stores pre-normalized vectors in one contiguous float32 matrix so a query is a single matrix-vector product
+
+import numpy as np
+
+
+def normalize(vectors):
+    # Scale rows to unit length so dot products equal cosine similarities
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k_indices(scores, k):
+    # Indices of the k highest scores, best first, without sorting the whole array
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class VectorIndex:
+    """
+    Exact cosine-similarity index over a contiguous matrix of unit-length vectors.
+    Every vector has an integer id; ids stay stable across additions and removals.
+    """
+    def __init__(self, initial_capacity=64):
+        self._initial_capacity = initial_capacity
+        self._matrix = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._size = 0
+        self._next_id = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self):
+        # View of the populated rows of the matrix
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._matrix[:self._size]
+
+    @property
+    def ids(self):
+        return self._ids[:self._size]
+
+    def _reserve(self, rows, dim):
+        # Grow the backing matrix geometrically so repeated adds are amortized O(1) per row
+        if self._matrix is None:
+            capacity = max(self._initial_capacity, rows)
+            self._matrix = np.empty((capacity, dim), dtype=np.float32)
+            self._ids = np.empty(capacity, dtype=np.int64)
+            return
+        if dim != self._matrix.shape[1]:
+            raise ValueError(f"Expected vectors of dimension {self._matrix.shape[1]}, got {dim}")
+        needed = self._size + rows
+        if needed > self._matrix.shape[0]:
+            capacity = max(needed, 2 * self._matrix.shape[0])
+            matrix = np.empty((capacity, dim), dtype=np.float32)
+            matrix[:self._size] = self._matrix[:self._size]
+            ids = np.empty(capacity, dtype=np.int64)
+            ids[:self._size] = self._ids[:self._size]
+            self._matrix, self._ids = matrix, ids
+
+    def add(self, vectors):
+        # Normalize once at insertion time and append rows; returns the new ids
+        rows = normalize(vectors)
+        self._reserve(rows.shape[0], rows.shape[1])
+        new_ids = np.arange(self._next_id, self._next_id + rows.shape[0], dtype=np.int64)
+        self._matrix[self._size:self._size + rows.shape[0]] = rows
+        self._ids[self._size:self._size + rows.shape[0]] = new_ids
+        self._size += rows.shape[0]
+        self._next_id += rows.shape[0]
+        self._on_add(rows)
+        return new_ids.tolist()
+
+    def remove(self, ids):
+        # Drop vectors by id, compacting the matrix in place without re-normalizing anything
+        keep = ~np.isin(self._ids[:self._size], np.asarray(list(ids), dtype=np.int64))
+        removed = self._size - int(keep.sum())
+        if removed:
+            kept_rows = np.flatnonzero(keep)
+            self._on_remove(keep)
+            self._matrix[:kept_rows.shape[0]] = self._matrix[kept_rows]
+            self._ids[:kept_rows.shape[0]] = self._ids[kept_rows]
+            self._size = kept_rows.shape[0]
+        return removed
+
+    def clear(self):
+        self._matrix = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._size = 0
+        self._next_id = 0
+
+    def scores(self, query):
+        # Cosine similarity of the query against every row in one vectorized call
+        if self._size == 0:
+            return np.empty(0, dtype=np.float32)
+        return self.vectors @ normalize(query)[0]
+
+    def scores_many(self, queries):
+        # Cosine similarities of several queries against every row as one (queries x rows) matrix product
+        queries = normalize(queries)
+        if self._size == 0:
+            return np.empty((queries.shape[0], 0), dtype=np.float32)
+        return queries @ self.vectors.T
+
+    def search(self, query, k):
+        # Return up to k (id, similarity) pairs, best first
+        scores = self.scores(query)
+        return [(int(self._ids[row]), float(scores[row])) for row in top_k_indices(scores, k)]
+
+    def best(self, query):
+        # Return (id, similarity) of the closest vector, or (None, None) when empty
+        results = self.search(query, 1)
+        return results[0] if results else (None, None)
+
+    def _on_add(self, rows):
+        # Hook for subclasses that keep auxiliary per-row state
+        pass
+
+    def _on_remove(self, keep):
+        pass
+
+
+class IVFVectorIndex(VectorIndex):
+    """
+    Approximate inverted-file index for large corpora.
+    Vectors are bucketed by their nearest k-means centroid and a query only scores
+    rows in the n_probe closest buckets. Falls back to exact search until enough
+    vectors exist to train the centroids.
+    """
+    def __init__(self, n_lists=64, n_probe=8, train_threshold=None, max_iterations=20, seed=0, initial_capacity=64):
+        super().__init__(initial_capacity=initial_capacity)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_threshold = train_threshold or 8 * n_lists
+        self.max_iterations = max_iterations
+        self.seed = seed
+        self.centroids = None
+        self._assignments = np.empty(0, dtype=np.int64)
+
+    def train(self):
+        # Spherical k-means over the current vectors; re-buckets every row
+        vectors = self.vectors
+        n_lists = min(self.n_lists, len(self))
+        if n_lists == 0:
+            return
+        rng = np.random.default_rng(self.seed)
+        centroids = vectors[rng.choice(len(self), n_lists, replace=False)].copy()
+        for _ in range(self.max_iterations):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            # Sums go to a new array so the convergence check compares against the previous centroids;
+            # an empty bucket keeps its centroid
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, vectors)
+            empty = np.bincount(assignments, minlength=n_lists) == 0
+            sums[empty] = centroids[empty]
+            new_centroids = normalize(sums)
+            if np.allclose(new_centroids, centroids, atol=1e-6):
+                break
+            centroids = new_centroids
+        self.centroids = centroids
+        self._assignments = np.argmax(vectors @ centroids.T, axis=1).astype(np.int64)
+
+    def _on_add(self, rows):
+        # Assign new rows to existing buckets, or train once the threshold is reached
+        if self.centroids is not None:
+            new_assignments = np.argmax(rows @ self.centroids.T, axis=1).astype(np.int64)
+            self._assignments = np.concatenate([self._assignments, new_assignments])
+        elif len(self) >= self.train_threshold:
+            self.train()
+
+    def _on_remove(self, keep):
+        if self.centroids is not None:
+            self._assignments = self._assignments[keep]
+
+    def clear(self):
+        super().clear()
+        self.centroids = None
+        self._assignments = np.empty(0, dtype=np.int64)
+
+    def search(self, query, k):
+        if self.centroids is None:
+            return super().search(query, k)
+        query = normalize(query)[0]
+        probes = top_k_indices(self.centroids @ query, self.n_probe)
+        candidates = np.flatnonzero(np.isin(self._assignments, probes))
+        scores = self.vectors[candidates] @ query
+        return [
+            (int(self._ids[candidates[i]]), float(scores[i]))
+            for i in top_k_indices(scores, k)
+        ]
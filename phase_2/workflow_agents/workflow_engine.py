@@ -0,0 +1,469 @@
+# Reusable product-planning workflow engine
+# Runs the planner -> router -> specialist agents -> evaluators pipeline for any product spec,
+# and many specs concurrently on one shared client, caches and rate limits
+# agentic_workflow.py (one spec, console output) and batch_workflow.py (many specs) are front ends to it
+
+import functools
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .base_agents import ROUTING_TIERS, ActionPlanningAgent, EvaluationAgent, KnowledgeAugmentedPromptAgent, RoutingAgent
+from .budget import BudgetExceededError
+from .checkpoint import CheckpointStore
+from .instrumentation import CallStatsAggregator, call_context
+from .routing_cache import RoutingCache
+from .step_scheduler import StepScheduler, build_step_graph
+from .validators import FEATURE_FIELDS, TASK_FIELDS, LabeledFieldsValidator, UserStoryValidator
+
+DEFAULT_WORKFLOW_PROMPT = """Create a comprehensive product development plan for the {product} product.
+This should include: user stories for different user types, product features that fulfill those stories,
+and detailed engineering tasks to implement those features."""
+
+PLANNER_KNOWLEDGE = """You extract actionable steps from a user's request for technical project management.
+For a request to create a full product development plan, you should extract steps like:
+1. Define user personas and user stories
+2. Define product features based on user stories
+3. Create detailed engineering tasks from features
+List each step on a new line, numbered.
+End each step with the numbers of the earlier steps whose output it needs, e.g. "(depends on: 1, 2)",
+or "(depends on: none)" if it can start immediately."""
+
+# Specialist roles: (name, routing description, persona, instructions, evaluation criteria, validator factory)
+ROLES = [
+    (
+        "Product Manager",
+        "Responsible for defining user personas and user stories for the {product} product. Does not define features or tasks. Does not group stories.",
+        "a Product Manager responsible for defining user personas and creating user stories",
+        """As a Product Manager, you define user personas and create user stories based on product specifications.
+User stories should follow this structure: As a [type of user], I want [an action or feature] so that [benefit/value].
+Focus on understanding user needs and translating them into clear, actionable stories.
+
+Product Specification:
+""",
+        "The answer should be stories that follow the following structure: As a [type of user], I want [an action or feature] so that [benefit/value].",
+        UserStoryValidator
+    ),
+    (
+        "Program Manager",
+        "Responsible for defining {product} product features and capabilities based on user stories. Does not create user stories or engineering tasks.",
+        "a Program Manager responsible for defining product features",
+        """As a Program Manager, you define product features based on user stories and product requirements.
+Features should be high-level capabilities that deliver value to users.
+Each feature should include: Feature Name, Description, Key Functionality, and User Benefit.
+
+Focus specifically on the {product} product. Use the product specification below to guide your feature definitions.
+
+Product Specification:
+""",
+        "The answer should be product features that follow the following structure: "
+        "Feature Name: A clear, concise title that identifies the capability\n"
+        "Description: A brief explanation of what the feature does and its purpose\n"
+        "Key Functionality: The specific capabilities or actions the feature provides\n"
+        "User Benefit: How this feature creates value for the user",
+        lambda: LabeledFieldsValidator(FEATURE_FIELDS, "feature")
+    ),
+    (
+        "Development Engineer",
+        "Responsible for creating detailed engineering tasks and technical implementation plans for the {product} product. Does not create user stories or features.",
+        "a Development Engineer responsible for creating detailed technical tasks",
+        """As a Development Engineer, you create detailed engineering tasks from features and user stories.
+Tasks must follow this EXACT format with ALL labeled fields:
+
+Task ID: [unique identifier like T001, T002, etc.]
+Task Title: [brief task name]
+Related User Story: [reference to the user story this relates to]
+Description: [detailed technical work explanation]
+Acceptance Criteria: [specific completion requirements]
+Estimated Effort: [time or complexity estimate]
+Dependencies: [prerequisite tasks or 'None']
+
+Each task MUST include all seven labeled fields above.
+
+Focus specifically on the {product} product. Use the product specification below to guide your task definitions.
+
+Product Specification:
+""",
+        "The answer should be tasks following this exact structure with labeled fields: "
+        "Task ID: [unique identifier]\n"
+        "Task Title: [brief task name]\n"
+        "Related User Story: [reference to user story]\n"
+        "Description: [detailed technical work explanation]\n"
+        "Acceptance Criteria: [specific completion requirements]\n"
+        "Estimated Effort: [time or complexity estimate]\n"
+        "Dependencies: [prerequisite tasks or 'None']\n\n"
+        "Each task must have ALL these labeled fields.",
+        lambda: LabeledFieldsValidator(TASK_FIELDS, "task")
+    )
+]
+
+EVALUATOR_PERSONA = "You are an evaluation agent that checks the answers of other worker agents"
+# Fields of a finished step kept in checkpoints and results
+STEP_FIELDS = ("step", "agent", "iterations", "passed", "output")
+SPEC_TITLE_PATTERN = re.compile(r"^\s*Product Specification\s*:\s*(.+?)\s*$", re.IGNORECASE | re.MULTILINE)
+SPEC_EXTENSIONS = (".txt", ".md")
+# Spec names become file names (results, checkpoints), so anything outside this set is replaced
+UNSAFE_NAME_PATTERN = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def product_name(spec, default=None):
+    # Product name from a "Product Specification: <name>" title line
+    match = SPEC_TITLE_PATTERN.search(spec)
+    return match.group(1) if match else default
+
+
+def safe_name(name):
+    # File-name-safe form of a spec name: no path separators, no leading dots, never empty
+    return UNSAFE_NAME_PATTERN.sub("_", str(name)).strip("._") or "spec"
+
+
+def unique_names(names, reserved=()):
+    """
+    Safe, distinct names for a list of spec names: duplicates (compared case-insensitively, as on
+    case-insensitive file systems) and names in reserved get a "-2", "-3", ... suffix.
+    """
+    taken = {name.lower() for name in reserved}
+    unique = []
+    for name in names:
+        base = candidate = safe_name(name)
+        suffix = 2
+        while candidate.lower() in taken:
+            candidate = f"{base}-{suffix}"
+            suffix += 1
+        taken.add(candidate.lower())
+        unique.append(candidate)
+    return unique
+
+
+def describe_validator(validator):
+    # Class and settings of a validator (patterns by their source), for checkpoint fingerprints
+    if validator is None:
+        return None
+    settings = {key: getattr(value, "pattern", value) for key, value in sorted(vars(validator).items())}
+    return [type(validator).__name__, settings]
+
+
+def categorize_outputs(steps, outputs):
+    # Group step outputs into user stories, features and tasks by step wording and output structure
+    categories = {"user_stories": [], "product_features": [], "engineering_tasks": []}
+    for step, output in zip(steps, outputs):
+        if not output:
+            continue
+        step_lower = step.lower()
+        output_lower = output.lower()
+        if ("user stor" in step_lower or "persona" in step_lower) and "as a" in output_lower:
+            categories["user_stories"].append(output)
+        elif "feature" in step_lower and ("feature name:" in output_lower or "key functionality:" in output_lower):
+            categories["product_features"].append(output)
+        elif ("task" in step_lower or "engineering" in step_lower) and "task id:" in output_lower:
+            categories["engineering_tasks"].append(output)
+    return categories
+
+
+def load_specs(path):
+    """
+    Read workflow specs from a directory of .txt/.md files or a JSONL file.
+    Each spec is a dict {"name", "spec", "product", "workflow_prompt"}; JSONL lines may give the spec text
+    inline ("spec") or as a path relative to the JSONL file ("spec_path"), plus optional "name", "product"
+    and "workflow_prompt".
+    """
+    if os.path.isdir(path):
+        return [
+            {"name": os.path.splitext(filename)[0], "spec": _read(os.path.join(path, filename))}
+            for filename in sorted(os.listdir(path)) if filename.endswith(SPEC_EXTENSIONS)
+        ]
+    specs = []
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "spec" not in entry:
+                spec_path = os.path.join(base_dir, entry["spec_path"])
+                entry["spec"] = _read(spec_path)
+                entry.setdefault("name", os.path.splitext(os.path.basename(spec_path))[0])
+            entry.setdefault("name", f"spec-{line_number}")
+            specs.append(entry)
+    return specs
+
+
+def _read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class WorkflowEngine:
+    """
+    Plans products from their specs: planner -> router -> specialist agents -> evaluators.
+    The engine owns the shared resources (LLM client with its scheduler, rate limits and completion cache,
+    embedding cache, routing decisions, optional checkpoint directory); each run gets its own lightweight
+    agents, so runs for different specs can execute concurrently. run() returns one structured result per spec.
+    Front ends such as agentic_workflow.py follow a run through hooks: on_plan(graph, resumed) once the steps
+    are known (resumed is the number of checkpointed results found), on_step_start(node) and
+    on_step_complete(node, record) around every step. With stream, a callable(label, tokens) that consumes a
+    token iterator and returns the full text, the plan ("plan") and each step's first draft ("draft") are streamed.
+    """
+    def __init__(self, client, embedding_cache=None, max_parallel_steps=4, max_interactions=5,
+                 knowledge_tokens=None, checkpoint_dir=None, routing_cache=None,
+                 on_plan=None, on_step_start=None, on_step_complete=None, stream=None):
+        self.client = client
+        self.embedding_cache = embedding_cache
+        self.routing_cache = routing_cache if routing_cache is not None else RoutingCache()
+        self.max_parallel_steps = max_parallel_steps
+        self.max_interactions = max_interactions
+        self.knowledge_tokens = knowledge_tokens
+        self.checkpoint_dir = checkpoint_dir
+        self.on_plan = on_plan
+        self.on_step_start = on_step_start
+        self.on_step_complete = on_step_complete
+        self.stream = stream
+        self.call_stats = client.add_hook(CallStatsAggregator(group_by=CallStatsAggregator.GROUP_BY + ("spec",)))
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def build_agents(self, product, spec):
+        # Planner and a router whose specialists wrap a knowledge agent with its evaluator
+        # Specialists are only constructed when a step is first routed to them
+        planner = ActionPlanningAgent(None, PLANNER_KNOWLEDGE, client=self.client)
+        router = RoutingAgent(None, embedding_cache=self.embedding_cache, client=self.client, routing_cache=self.routing_cache)
+        router.register_agents([
+            {
+                "name": name,
+                "description": description.format(product=product),
+                "func": functools.partial(self._run_specialist, functools.cache(functools.partial(
+                    self._build_specialist, spec, persona, instructions.format(product=product), criteria, make_validator
+                )))
+            }
+            for name, description, persona, instructions, criteria, make_validator in ROLES
+        ])
+        return planner, router
+
+    def _build_specialist(self, spec, persona, instructions, criteria, make_validator):
+        worker = KnowledgeAugmentedPromptAgent(
+            None, persona, spec,
+            client=self.client,
+            pinned_knowledge=instructions,
+            max_knowledge_tokens=self.knowledge_tokens,
+            embedding_cache=self.embedding_cache
+        )
+        evaluator = EvaluationAgent(
+            None, EVALUATOR_PERSONA, criteria, worker,
+            max_interactions=self.max_interactions,
+            client=self.client,
+            pre_check=make_validator()
+        )
+        return worker, evaluator
+
+    def _run_specialist(self, build, query):
+        # The worker's first answer is handed to the evaluator so it is not generated twice
+        worker, evaluator = build()
+        draft = self.stream("draft", worker.respond_stream(query)) if self.stream else worker.respond(query)
+        return {**evaluator.evaluate(query, initial_response=draft), "draft": draft}
+
+    def _checkpoints(self, name, product, spec, router, path=None):
+        if not path and self.checkpoint_dir:
+            path = os.path.join(self.checkpoint_dir, f"{safe_name(name)}.json")
+        if not path:
+            return None
+        return CheckpointStore(path, fingerprint=self.fingerprint(product, spec, router))
+
+    def fingerprint(self, product, spec, router):
+        # Every input besides a step's own text that shapes its output: prompts and personas, evaluation criteria
+        # and validators, evaluation and knowledge limits, models, and the routing descriptions and settings
+        roles = [
+            {
+                "name": name,
+                "persona": persona,
+                "instructions": instructions.format(product=product),
+                "criteria": criteria,
+                "validator": describe_validator(make_validator())
+            }
+            for name, _, persona, instructions, criteria, make_validator in ROLES
+        ]
+        routing = {
+            "agents": [[agent["name"], agent["description"]] for agent in router.agents],
+            "lexical_margin": router.lexical_margin,
+            "min_lexical_terms": router.min_lexical_terms,
+            "embedding_margin": router.embedding_margin,
+            "llm_tiebreak": router.llm_tiebreak
+        }
+        return CheckpointStore.make_fingerprint(
+            spec, product, PLANNER_KNOWLEDGE, roles, EVALUATOR_PERSONA, self.max_interactions, self.knowledge_tokens,
+            self.client.chat_model, self.client.embedding_model, routing
+        )
+
+    def run(self, spec, name="spec", product=None, workflow_prompt=None, checkpoint_path=None, fresh=False):
+        """
+        Run the whole workflow for one spec and return {"name", "product", "status", "error", "seconds",
+        "steps", "user_stories", "product_features", "engineering_tasks", "usage", "routing"}. Failures are reported
+        in the result (status "error") rather than raised, so one bad spec does not stop a batch; a step the
+        budget does not allow is skipped and recorded with the reason in its "skipped" field.
+        checkpoint_path overrides the checkpoint_dir location; fresh discards existing checkpoints first.
+        """
+        start = time.perf_counter()
+        product = product or product_name(spec, default=name)
+        workflow_prompt = workflow_prompt or DEFAULT_WORKFLOW_PROMPT.format(product=product)
+        result = {"name": name, "product": product, "status": "ok", "error": None, "steps": [], "routing": None}
+        try:
+            with call_context(spec=name):
+                result["steps"], result["routing"] = self._run_steps(
+                    spec, name, product, workflow_prompt, checkpoint_path, fresh
+                )
+        except Exception as error:
+            result["status"] = "error"
+            result["error"] = f"{type(error).__name__}: {error}"
+        # Routing decisions are saved in batches; write whatever this run added
+        self.routing_cache.flush()
+        result.update(categorize_outputs([s["step"] for s in result["steps"]], [s["output"] for s in result["steps"]]))
+        result["seconds"] = time.perf_counter() - start
+        result["usage"] = self.call_stats.summary()["by_spec"].get(name)
+        return result
+
+    def _run_steps(self, spec, name, product, workflow_prompt, checkpoint_path=None, fresh=False):
+        # Returns the step records and the router's per-tier statistics
+        with call_context(step="Setup"):
+            planner, router = self.build_agents(product, spec)
+        checkpoints = self._checkpoints(name, product, spec, router, checkpoint_path)
+        if checkpoints is not None and fresh:
+            checkpoints.clear()
+        resumed = len(checkpoints) if checkpoints is not None else 0
+
+        plan = checkpoints.get("plan", workflow_prompt) if checkpoints is not None else None
+        if plan is not None:
+            workflow_steps = plan["steps"]
+        else:
+            with call_context(step="Planning", role="Action Planner"):
+                if self.stream:
+                    workflow_steps = planner.parse_steps(self.stream("plan", planner.plan_stream(workflow_prompt)))
+                else:
+                    workflow_steps = planner.extract_steps_from_prompt(workflow_prompt)
+            if checkpoints is not None:
+                checkpoints.put("plan", workflow_prompt, steps=workflow_steps)
+        # Unannotated steps wait for the step before them
+        graph = build_step_graph(workflow_steps)
+        if self.on_plan:
+            self.on_plan(graph, resumed)
+
+        def step_prompt(step, dependency_results):
+            context = "\n\n".join(
+                f"Output of step {index + 1}:\n{output}"
+                for index, output in sorted(dependency_results.items()) if output
+            )
+            if not context:
+                return step
+            return f"{step}\n\nUse the outputs of the prerequisite steps below as input.\n\n{context}"
+
+        # Steps whose inputs, dependency outputs included, are all checkpointed will be restored, so they are
+        # neither routed nor run
+        restored = {}
+        if checkpoints is not None:
+            for node in graph:
+                if all(index in restored for index in node["depends_on"]):
+                    outputs = {index: restored[index]["output"] for index in node["depends_on"]}
+                    record = checkpoints.get("step", step_prompt(node["step"], outputs))
+                    if record is not None:
+                        restored[node["index"]] = record
+
+        # Steps are routed on their text alone, so the remaining ones are routed in one batch before any runs;
+        # if the budget stops the batch, each step is routed (or skipped) when it runs
+        step_texts = [node["step"] for node in graph if node["index"] not in restored]
+        routes = {}
+        if step_texts:
+            try:
+                with call_context(spec=name, step="Routing", role="Routing Agent"):
+                    routes = dict(zip(step_texts, router.select_agents(step_texts)))
+            except BudgetExceededError:
+                pass
+        records = {}
+
+        def execute_step(step, dependency_results):
+            # Scheduler threads do not inherit the caller's context, so the spec label is set again here
+            # Every LLM call made for a step is labelled with the step and the routed role
+            prompt = step_prompt(step, dependency_results)
+            record = checkpoints.get("step", prompt) if checkpoints is not None else None
+            if record is not None:
+                record.update(restored=True, skipped=None)
+            else:
+                record = {"step": step, "agent": None, "iterations": 0, "passed": None, "output": None,
+                          "restored": False, "skipped": None}
+                try:
+                    with call_context(spec=name, step=step):
+                        best_agent, _ = routes.get(step) or router.select_agent(step)
+                    if best_agent is not None:
+                        with call_context(spec=name, step=step, role=best_agent["name"]):
+                            evaluation = best_agent["func"](prompt)
+                        record.update(
+                            agent=best_agent["name"],
+                            iterations=evaluation["iterations"],
+                            passed=evaluation.get("passed"),
+                            output=evaluation["final_response"],
+                            draft=evaluation["draft"]
+                        )
+                        if checkpoints is not None:
+                            checkpoints.put("step", prompt, **{key: record[key] for key in STEP_FIELDS})
+                except BudgetExceededError as error:
+                    record["skipped"] = str(error)
+            records[step] = record
+            return record["output"]
+
+        scheduler = StepScheduler(
+            execute_step,
+            max_workers=self.max_parallel_steps,
+            on_step_start=self.on_step_start,
+            on_step_complete=(
+                (lambda node, _: self.on_step_complete(node, records[node["step"]])) if self.on_step_complete else None
+            )
+        )
+        scheduler.run(graph)
+        return [
+            {key: records[node["step"]][key] for key in STEP_FIELDS + ("skipped",)}
+            for node in graph
+        ], router.stats()
+
+    def run_many(self, specs, max_workflows=4, output_dir=None, on_result=None, reserved_names=()):
+        """
+        Run many specs (dicts as returned by load_specs) concurrently, at most max_workflows at a time.
+        Spec names are made file-name safe and distinct (see unique_names; reserved_names are file names the
+        caller writes itself), and each result, under that name, is written to output_dir/<name>.json when
+        output_dir is set and passed to on_result as it finishes.
+        Returns (results in input order, batch statistics including specs per hour).
+        """
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        names = unique_names([entry["name"] for entry in specs], reserved=reserved_names)
+        start = time.perf_counter()
+        results = [None] * len(specs)
+        with ThreadPoolExecutor(max_workers=max_workflows) as executor:
+            futures = {
+                executor.submit(
+                    self.run, entry["spec"], name=name,
+                    product=entry.get("product"), workflow_prompt=entry.get("workflow_prompt")
+                ): index
+                for index, (entry, name) in enumerate(zip(specs, names))
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                if output_dir:
+                    with open(os.path.join(output_dir, f"{result['name']}.json"), "w", encoding="utf-8") as f:
+                        json.dump(result, f, indent=2)
+                if on_result:
+                    on_result(result)
+        seconds = time.perf_counter() - start
+        succeeded = sum(result["status"] == "ok" for result in results)
+        stats = {
+            "specs": len(specs),
+            "succeeded": succeeded,
+            "failed": len(specs) - succeeded,
+            "seconds": seconds,
+            "specs_per_hour": 3600 * len(specs) / seconds if seconds > 0 else None,
+            "usage": self.call_stats.summary()["total"],
+            "routing_tiers": {
+                tier: sum(result["routing"]["tiers"][tier]["hits"] for result in results if result["routing"])
+                for tier in ROUTING_TIERS
+            }
+        }
+        return results, stats